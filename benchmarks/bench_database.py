@@ -0,0 +1,119 @@
+"""
+lookups per second of `database.get_user_by_id` (it runs on every command), and the speed of the other hot queries,
+compared with the old data layer (a new connection for every query, and no indexes).
+also the time and the peak memory of going over all the users (like the scheduled jobs do)
+
+usage: python benchmarks/bench_database.py [--users 10000]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import database  # noqa: E402
+
+
+def create_old_database(path: str, users: int):
+    with sqlite3.connect(path) as con:
+        con.execute('CREATE TABLE IF NOT EXISTS "users" ("user_id" NUMERIC, "user_name" TEXT, "password" TEXT, '
+                    '"schedule_code" INTEGER, "year" INTEGER NOT NULL DEFAULT 0)')
+        # most of the users do not get scheduled messages
+        con.executemany('INSERT INTO users VALUES(?,?,?,?,0)',
+                        ((user_id, f'{300000000 + user_id}', 'password', [1, 2][user_id % 2] if user_id % 10 < 2 else 0)
+                         for user_id in range(1, users + 1)))
+
+
+def old_get_user_by_id(path: str, user_id: int):
+    with sqlite3.connect(path) as con:
+        user = con.execute('SELECT * FROM users WHERE user_id=?', (user_id,)).fetchone()
+        return user and database.User(*user)
+
+
+def old_add_user(path: str, user_id: int, user_name: str, password: str):
+    with sqlite3.connect(path) as con:
+        con.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+    with sqlite3.connect(path) as con:
+        con.execute('INSERT INTO users VALUES(?,?,?,0,0)', (user_id, user_name, password))
+
+
+def old_get_users_by_schedule(path: str, schedule_code: int):
+    with sqlite3.connect(path) as con:
+        return [database.User(*user) for user in
+                con.execute('SELECT * FROM users WHERE schedule_code=?', (schedule_code,))]
+
+
+def old_get_all_users(path: str):
+    with sqlite3.connect(path) as con:
+        return (database.User(*user) for user in con.execute('SELECT * FROM users'))
+
+
+def scan(users) -> tuple:
+    """
+    :return: (seconds to go over the users, peak memory in bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in users:
+        pass
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def per_second(function, users: int) -> float:
+    timer = timeit.Timer(lambda: function(random.randint(1, users)))
+    number, _ = timer.autorange()
+    return number / min(timer.repeat(repeat=3, number=number))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10_000)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    old_path = os.path.join(work_dir, 'old.db')
+    create_old_database(old_path, args.users)
+    # the new data layer migrates a copy of the same database
+    database.DATABASE = os.path.join(work_dir, 'database.db')
+    shutil.copy(old_path, database.DATABASE)
+    try:
+        # add_user resets the schedule of the users, so it runs last
+        cases = [
+            ('get_user_by_id',
+             lambda user_id: old_get_user_by_id(old_path, user_id),
+             database.get_user_by_id),
+            ('get_users_by_schedule',
+             lambda user_id: old_get_users_by_schedule(old_path, 1 + user_id % 2),
+             lambda user_id: list(database.get_users_by_schedule(1 + user_id % 2))),
+            ('add_user',
+             lambda user_id: old_add_user(old_path, user_id, 'user', 'password'),
+             lambda user_id: database.add_user(user_id, 'user', 'password')),
+        ]
+        print(f'{args.users} users\n')
+        print(f'{"query":<24}{"old per sec":>14}{"new per sec":>14}{"speedup":>10}')
+        for name, old, new in cases:
+            old_rate, new_rate = per_second(old, args.users), per_second(new, args.users)
+            print(f'{name:<24}{old_rate:>14.0f}{new_rate:>14.0f}{new_rate / old_rate:>10.1f}')
+
+        print(f'\n{"scan of all the users":<40}{"ms":>10}{"peak KiB":>10}')
+        for name, users in (('old (one open statement)', old_get_all_users(old_path)),
+                            ('iter_users', database.iter_users()),
+                            ('iter_users (only user_id)', database.iter_users(columns=('user_id',)))):
+            seconds, peak = scan(users)
+            print(f'{name:<40}{seconds * 1000:>10.1f}{peak / 1024:>10.0f}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
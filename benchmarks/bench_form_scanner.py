@@ -0,0 +1,60 @@
+"""
+compare the old `Internet.__get_hidden_inputs` (regex over the decoded page + year regex)
+with `form_scanner.scan_form` (one pass over the raw bytes) on big orbit-like pages
+
+usage: python benchmarks/bench_form_scanner.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from form_scanner import scan_form  # noqa: E402
+
+
+def old_get_hidden_inputs(text: str) -> dict:
+    hidden_input_regex = r"<input type=\"hidden\" name=\"(.*?)\" id=\".*?\" value=\"(.*?)\" \/>"
+    hidden_inputs = re.findall(hidden_input_regex, text, re.DOTALL)
+    year_regex = '<select name="ctl00\\$cmbActiveYear".*?<option selected="selected" value="([0-9]*?)"'
+    year = re.findall(year_regex, text, re.DOTALL)
+    if year:
+        hidden_inputs.append(('ctl00$cmbActiveYear', int(year[0])))
+    return dict(hidden_inputs)
+
+
+def make_page(rows: int, view_state_size: int) -> bytes:
+    view_state = ('A' * 63 + '/') * (view_state_size // 64)
+    hidden = ''.join(f'<input type="hidden" name="__INPUT{i}" id="__INPUT{i}" value="value{i}" />\n'
+                     for i in range(20))
+    years = ''.join(f'<option value="{year}">{year}</option>' for year in range(2015, 2023))
+    grid = ''.join(f'<tr id="ContentPlaceHolder1_gvGradesList" class="GridRow">'
+                   f'<td>{i}</td><td>קורס מספר {i}</td><td>&nbsp;</td><td>א\'</td><td>3</td><td>&nbsp;</td>'
+                   f'<td><span>9{i % 10}</span></td></tr>\n' for i in range(rows))
+    page = (f'<html><body><form>'
+            f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{view_state}" />\n'
+            f'<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{view_state[:4096]}" />\n'
+            f'{hidden}'
+            f'<select name="ctl00$cmbActiveYear" id="cmbActiveYear">{years}'
+            f'<option selected="selected" value="2023">2023</option></select>'
+            f'<table>{grid}</table></form></body></html>')
+    return page.encode('utf-8')
+
+
+def main():
+    number = 50
+    for rows, view_state_size in ((50, 20_000), (500, 200_000), (2000, 1_000_000)):
+        content = make_page(rows, view_state_size)
+        old = old_get_hidden_inputs(content.decode('utf-8'))
+        old.pop('ctl00$cmbActiveYear')
+        assert scan_form(content) == (old, 2023)
+
+        old_time = timeit.timeit(lambda: old_get_hidden_inputs(content.decode('utf-8')), number=number) / number
+        new_time = timeit.timeit(lambda: scan_form(content), number=number) / number
+        print(f'{len(content) / 1024:8.0f} KiB page: old {old_time * 1000:7.2f} ms, '
+              f'new {new_time * 1000:7.2f} ms, x{old_time / new_time:.1f}')
+
+
+if __name__ == '__main__':
+    main()
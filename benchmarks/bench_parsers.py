@@ -0,0 +1,94 @@
+"""
+replay orbit and moodle pages through every parser in `src/parsers.py`,
+report the time per page and the peak memory of every parser
+
+the pages are synthetic pages (see `orbit_pages.py`) and, if given, pages recorded by the bot:
+run the bot with `ORBIT_RECORD_DIR=<dir>` and pass that dir with `--fixtures <dir>`
+
+usage: python benchmarks/bench_parsers.py [--fixtures DIR] [--scale N]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import orbit_pages  # noqa: E402
+import parsers  # noqa: E402
+
+# orbit page name -> (parser, start of the grid rows in the page (used to enlarge the page))
+PAGE_PARSERS = {
+    'Main.aspx': (parsers.parse_years, None),
+    'StudentGradesList.aspx': (lambda text: parsers.parse_grades(text, 1),
+                               '<tr id="ContentPlaceHolder1_gvGradesList" class="GridRow">'),
+    'StudentAssignmentTermList.aspx': (parsers.parse_exams,
+                                       '<tr id="ContentPlaceHolder1_gvStudentAssignmentTermList" class="GridRow">'),
+    'StudentPeriodSchedule.aspx': (parsers.parse_time_table,
+                                   '<tr id="ContentPlaceHolder1_PeriodScheduleA_gvPeriodSchedule" class="GridRow">'),
+    'CreateStudentWeeklySchedule.aspx': (parsers.parse_lessons, None),
+}
+
+
+def synthetic_cases(scale: int):
+    for rows in (10, 100, 100 * scale):
+        yield f'grades {rows} rows', lambda text: parsers.parse_grades(text, 1), orbit_pages.grades_page(rows)
+        yield f'exams {rows} rows', parsers.parse_exams, orbit_pages.exams_page(rows)
+        yield f'time table {rows} rows', parsers.parse_time_table, orbit_pages.time_table_page(rows)
+        yield f'lessons {rows} rows', parsers.parse_lessons, orbit_pages.lessons_page(orbit_pages.lesson_codes(rows))
+    yield 'grade pages count', parsers.parse_grade_pages_count, orbit_pages.grades_page(20, pages=9)
+    yield 'grade distribution', parsers.parse_grade_distribution, orbit_pages.grade_distribution_page()
+    yield 'years', parsers.parse_years, orbit_pages.main_page()
+    yield 'sesskey', parsers.parse_sesskey, orbit_pages.moodle_page()
+
+
+def recorded_cases(fixtures: str, scale: int):
+    with open(os.path.join(fixtures, 'index.jsonl'), encoding='utf-8') as index:
+        for line in index:
+            record = json.loads(line)
+            name = os.path.basename(record['path'])
+            if record['method'] != 'POST' or name not in PAGE_PARSERS:
+                continue
+            parser, row_start = PAGE_PARSERS[name]
+            with open(os.path.join(fixtures, record['file']), encoding='utf-8') as file:
+                text = file.read()
+            yield record['file'], parser, text
+            if row_start and row_start in text:
+                yield f'{record["file"]} x{scale}', parser, orbit_pages.enlarge(text, row_start, scale)
+
+
+def measure(parser, text: str):
+    """
+    :return: (seconds per page, peak memory in bytes)
+    """
+    timer = timeit.Timer(lambda: parser(text))
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=3, number=number)) / number
+
+    tracemalloc.start()
+    parser(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--fixtures', help='dir with pages recorded with ORBIT_RECORD_DIR')
+    arg_parser.add_argument('--scale', type=int, default=5, help='how much to enlarge the pages')
+    args = arg_parser.parse_args()
+
+    cases = list(synthetic_cases(args.scale))
+    if args.fixtures:
+        cases += list(recorded_cases(args.fixtures, args.scale))
+
+    print(f'{"page":<45}{"KiB":>8}{"ms/page":>10}{"peak KiB":>10}')
+    for name, parser, text in cases:
+        seconds, peak = measure(parser, text)
+        print(f'{name:<45}{len(text.encode("utf-8")) / 1024:>8.0f}{seconds * 1000:>10.3f}{peak / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
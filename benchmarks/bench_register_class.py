@@ -0,0 +1,80 @@
+"""
+registration to all the lessons of a class (`Internet.register_for_class`, the /register_class button),
+against the local fake server (see `fake_server.py`).
+reports the orbit requests and the cpu time of the bot (the thread of the event loop, without the fake server)
+for every registered class, by the number of lessons in the registration page
+
+usage: python benchmarks/bench_register_class.py [--lessons 40 200 400] [--runs 5]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from fake_server import FakeConfig, FakeServer  # noqa: E402
+
+# the lessons of the fake server are split to 4 classes, A to D
+CLASS_NAME = 'A'
+
+
+async def register(server: FakeServer, user_ids: range) -> list:
+    """
+    :return: (orbit requests, cpu seconds, lessons registered and failed) of every user
+    """
+    import connection_pool
+    import database
+    from internet import Internet
+
+    results = []
+    try:
+        for user_id in user_ids:
+            database.add_user(user_id, f'{300000000 + user_id}', 'password')
+            async with Internet(database.get_user_by_id(user_id)) as internet:
+                await internet.connect_orbit()
+                requests = sum(server.state.requests.values())
+                start = time.thread_time()
+                res = await internet.register_for_class(CLASS_NAME)
+                cpu = time.thread_time() - start
+            results.append((sum(server.state.requests.values()) - requests, cpu, sum(map(len, res.result))))
+    finally:
+        # the connections belong to the event loop of this run
+        await connection_pool.transport.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lessons', type=int, nargs='+', default=[40, 200, 400])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.chdir(work_dir)
+    try:
+        print(f'{"lessons":>8}{"of class":>10}{"requests":>10}{"cpu ms":>10}{"cpu ms/lesson":>15}')
+        for first_user, lessons in enumerate(args.lessons):
+            server = FakeServer(config=FakeConfig(lessons=lessons)).start()
+            os.environ.update(server.environment())
+            # the urls of orbit are read when internet is imported
+            for module in ('internet', 'session_pool'):
+                sys.modules.pop(module, None)
+            try:
+                user_ids = range(first_user * args.runs + 1, (first_user + 1) * args.runs + 1)
+                results = asyncio.run(register(server, user_ids))
+            finally:
+                server.shutdown()
+            requests, cpu, handled = results[-1][0], statistics.median(r[1] for r in results), results[-1][2]
+            print(f'{lessons:>8}{handled:>10}{requests:>10}{cpu * 1000:>10.1f}{cpu * 1000 / handled:>15.2f}')
+    finally:
+        os.chdir('/')
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
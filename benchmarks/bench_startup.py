@@ -0,0 +1,77 @@
+"""
+startup time of the bot process (until its first getUpdates) and of a scheduled job that runs on its own
+(`scheduler.run_job`, until its first request), against the local fake server (see `fake_server.py`).
+also lists the heavy modules that are loaded by importing the bot and the scheduler
+
+usage: python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_server import FakeServer
+from load_test import SRC, TOKEN, create_database
+
+HEAVY_MODULES = ('PIL', 'fpdf', 'fontTools')
+
+# (name, main module, code of the process, the first request it sends to the fake server)
+PROCESSES = [
+    ('bot', 'telegram_bot', f'import telegram_bot; telegram_bot.start_telegram_bot({TOKEN!r})',
+     'telegram getUpdates'),
+    ('scheduler', 'scheduler', f'import scheduler; scheduler.run_job({TOKEN!r}, scheduler.check_grades)',
+     'telegram getMe'),
+]
+
+
+def loaded_modules(module: str) -> list:
+    code = f'import sys, {module}; print(*[name for name in {HEAVY_MODULES!r} if name in sys.modules])'
+    output = subprocess.run([sys.executable, '-c', code], cwd=SRC, capture_output=True, text=True, check=True)
+    return output.stdout.split()
+
+
+def time_to_first_request(code: str, request: str, work_dir: str, timeout: float = 30) -> float:
+    """
+    :return: seconds from starting the process until the fake server got `request` from it
+    """
+    server = FakeServer().start()
+    environment = dict(os.environ, **server.environment(), PYTHONPATH=SRC)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=work_dir, env=environment,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while request not in server.state.first_request:
+            if time.perf_counter() - start > timeout or process.poll() is not None:
+                raise RuntimeError(f'{request} was not sent')
+            time.sleep(0.001)
+        return server.state.first_request[request] - start
+    finally:
+        process.terminate()
+        process.wait()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    create_database(os.path.join(work_dir, 'database.db'), 1)
+    shutil.copy(os.path.join(SRC, 'david.ttf'), work_dir)
+    try:
+        print(f'{"process":<12}{"first request":<22}{"median s":>10}{"min s":>10}   heavy modules loaded')
+        for name, module, code, request in PROCESSES:
+            times = [time_to_first_request(code, request, work_dir) for _ in range(args.runs)]
+            print(f'{name:<12}{request:<22}{statistics.median(times):>10.3f}{min(times):>10.3f}   '
+                  f'{" ".join(loaded_modules(module)) or "-"}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+lay out and render a full weekly time table with `HebrewTimeTablePDF`,
+and compare the hebrew layout with the old layout (measuring the whole line with PIL for every word)
+
+usage: python benchmarks/bench_time_table.py [--classes 40]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+from PIL import ImageFont
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+# the font is loaded from the working dir
+os.chdir(SRC)
+
+from time_table_to_pdf import HebrewTimeTablePDF, WIDTH_SCALE  # noqa: E402
+
+HEBREW_CHARS = '()אבגדהוזחטיכלמנסעפצקרשתםךףץן '
+FONT = ImageFont.truetype('david.ttf', 10)
+
+
+def old_hebrew_fixer(text: str, max_width) -> str:
+    """
+    the layout before the glyph widths cache (kept here to compare with)
+    """
+    new_text = []
+    for line in text.split('\n'):
+        new_text.append('')
+        for word in line.split(' '):
+            if not new_text[-1]:
+                new_text[-1] = word
+            elif FONT.getlength(new_text[-1] + ' ' + word) / WIDTH_SCALE < max_width:
+                new_text[-1] += ' ' + word
+            else:
+                new_text.append(word)
+
+    new_text = [text for text in new_text][::-1]
+    text = '\n'.join(new_text)
+    if not text:
+        return ''
+    text = text[::-1]
+    text = ''.join([chr(ord('(') + ord(')') - ord(char)) if char in '()' else char for char in text])
+    start = 0
+    is_hebrew = text[0] in HEBREW_CHARS
+    end_text = ''
+    for index, char in enumerate(text):
+        if (char in HEBREW_CHARS) != is_hebrew or char == '\n':
+            if is_hebrew:
+                end_text += text[start:index]
+            else:
+                if start > 0:
+                    end_text += text[index - 1:start - 1:-1]
+                else:
+                    end_text += text[index - 1::-1]
+            if char == '\n':
+                is_hebrew = '\n'
+            else:
+                is_hebrew = char in HEBREW_CHARS
+            start = index
+    if is_hebrew:
+        end_text += text[start:]
+    else:
+        if start == 0:
+            end_text += text[::-1]
+        else:
+            end_text += text[:start - 1:-1]
+    return end_text
+
+
+def weekly_time_table(classes: int):
+    """
+    :return: list of (name, day, start hour, end hour, lecturer, room), like `parsers.parse_time_table`
+    """
+    return [(f'מבוא למדעי המחשב (חלק {index % 3 + 1}) - קבוצה {index}', index % 6, 8 + index % 10 + 0.5,
+             10 + index % 10 + 0.25, f'ד"ר ישראל ישראלי {index % 7}', f'בניין מזא"ה, כיתה {100 + index}')
+            for index in range(classes)]
+
+
+def cell_texts(time_table):
+    return [my_class[0] + '\n\n' + my_class[4] + '\n\n' + my_class[5] for my_class in time_table]
+
+
+def best_time(function, repeat: int = 5) -> float:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--classes', type=int, default=40, help='number of classes in the week')
+    args = parser.parse_args()
+
+    time_table = weekly_time_table(args.classes)
+    texts = cell_texts(time_table)
+    width = HebrewTimeTablePDF(time_table).epw / 7
+    fixer = HebrewTimeTablePDF._HebrewTimeTablePDF__hebrew_fixer
+    cold_fixer = fixer.__wrapped__
+
+    mismatches = sum(old_hebrew_fixer(text, width) != cold_fixer(text, width) for text in texts)
+    print(f'{len(texts)} cells, {mismatches} cells laid out differently than the old layout\n')
+
+    old = best_time(lambda: [old_hebrew_fixer(text, width) for text in texts])
+    cold = best_time(lambda: [cold_fixer(text, width) for text in texts])
+    warm = best_time(lambda: [fixer(text, width) for text in texts])
+    print(f'{"layout of all the cells":<32}{"ms":>10}{"speedup":>10}')
+    for name, seconds in (('old', old), ('new (not memoized)', cold), ('new (memoized)', warm)):
+        print(f'{name:<32}{seconds * 1000:>10.3f}{old / seconds:>10.1f}')
+
+    render = best_time(lambda: HebrewTimeTablePDF(time_table).get_output(), repeat=3)
+    print(f'\nfull render (layout memoized): {render * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+compare getting the updates by long polling and by a webhook, against the local fake server (see `fake_server.py`):
+- latency: simulated chats send commands one after the other, the time from an update until its reply
+- burst: the time until the bot confirms a burst of updates (the replies are not waited for,
+  they are limited by the send queue to about 30 messages per second in both modes)
+
+usage: python benchmarks/bench_webhook.py [--chats 10] [--duration 10] [--burst 2000]
+"""
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+from fake_server import FakeServer, message_update
+from load_test import SRC, create_database, start_bot, Results, chat_loop
+
+WEBHOOK_SECRET = 'bench-secret'
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(condition, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f'timeout waiting for {what}')
+        time.sleep(0.001)
+
+
+def run_mode(mode: str, work_dir: str, chats: int, duration: float, think_time: float, burst: int):
+    """
+    :return: (latencies of the replies, updates per second of the burst)
+    """
+    server = FakeServer().start()
+    environment = {}
+    if mode == 'webhook':
+        port = free_port()
+        environment = {'TELEGRAM_WEBHOOK_URL': f'http://127.0.0.1:{port}/webhook',
+                       'TELEGRAM_WEBHOOK_LISTEN': '127.0.0.1',
+                       'TELEGRAM_WEBHOOK_PORT': str(port),
+                       'TELEGRAM_WEBHOOK_SECRET': WEBHOOK_SECRET}
+    bot = start_bot(work_dir, server, **environment)
+    try:
+        ready = 'telegram setWebhook' if mode == 'webhook' else 'telegram getUpdates'
+        wait_for(lambda: ready in server.state.first_request, 60, ready)
+
+        # /update_schedule is answered without orbit and moodle, only the way of the update is measured
+        scenarios = [[('/update_schedule', lambda chat: message_update(chat, '/update_schedule'), 1)]]
+        results = Results()
+        end_time = time.monotonic() + duration
+        threads = [threading.Thread(target=chat_loop,
+                                    args=(server, chat_id, end_time, think_time, 30, results, scenarios))
+                   for chat_id in range(1, chats + 1)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        delivered = server.state.delivered
+        start = time.perf_counter()
+        for chat_id in range(chats + 1, chats + burst + 1):
+            server.state.push_update(message_update(chat_id, '/update_schedule'))
+        wait_for(lambda: server.state.delivered >= delivered + burst, 60, 'the burst')
+        return results.latencies['/update_schedule'], burst / (time.perf_counter() - start)
+    finally:
+        # the replies of the burst are still in the send queue, there is no need to wait for them
+        bot.kill()
+        bot.wait()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=10, help='number of simulated chats in the latency test')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of the latency test')
+    parser.add_argument('--think-time', type=float, default=2,
+                        help='average seconds between commands of a chat (below 1 the send queue adds latency)')
+    parser.add_argument('--burst', type=int, default=2000, help='number of updates in the burst')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    create_database(os.path.join(work_dir, 'database.db'), args.chats + args.burst)
+    shutil.copy(os.path.join(SRC, 'david.ttf'), work_dir)
+    try:
+        print(f'{"mode":<10}{"replies":>9}{"p50 ms":>9}{"p90 ms":>9}{"p99 ms":>9}{"burst updates/s":>17}')
+        for mode in ('polling', 'webhook'):
+            latencies, burst_rate = run_mode(mode, work_dir, args.chats, args.duration, args.think_time,
+                                                  args.burst)
+            quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+            print(f'{mode:<10}{len(latencies):>9}{quantiles[49] * 1000:>9.1f}{quantiles[89] * 1000:>9.1f}'
+                  f'{quantiles[98] * 1000:>9.1f}{burst_rate:>17.0f}')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
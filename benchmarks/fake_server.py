@@ -0,0 +1,475 @@
+"""
+local stand-in for orbit, moodle and the telegram bot api, for end-to-end load testing of the bot
+
+all three are served from one http server:
+    orbit:    /hadassah/...          (set ORBIT_HOST=http://127.0.0.1:<port>)
+    moodle:   /moodle/...            (set MOODLE_URL=http://127.0.0.1:<port>/moodle)
+    telegram: /bot<token>/<method>   (set TELEGRAM_API_URL=http://127.0.0.1:<port>/bot)
+
+after the bot calls setWebhook, the updates are posted to its webhook instead of returned by getUpdates
+
+usage: python benchmarks/fake_server.py [--port 8081] [--latency 0.2] [--error-rate 0.01]
+"""
+import argparse
+import email.parser
+import email.policy
+import http.client
+import itertools
+import json
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+import orbit_pages
+
+# 1x1 png, returned as the grade distribution chart
+CHART_PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                          '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082')
+FAKE_PDF = b'%PDF-1.4\n1 0 obj<<>>endobj\ntrailer<<>>\n%%EOF\n'
+
+
+class FakeConfig:
+    def __init__(self,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 telegram_latency: float = 0.0,
+                 telegram_flood_rate: float = 0.0,
+                 grade_pages: int = 3,
+                 grade_rows: int = 20,
+                 shared_view_state: bool = True,
+                 exams: int = 30,
+                 time_table_rows: int = 20,
+                 lessons: int = 40,
+                 events: int = 30):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.telegram_latency = telegram_latency
+        self.telegram_flood_rate = telegram_flood_rate
+        self.grade_pages = grade_pages
+        self.grade_rows = grade_rows
+        # False: a page of the grades list is returned only to a postback from the previous page
+        self.shared_view_state = shared_view_state
+        self.exams = exams
+        self.time_table_rows = time_table_rows
+        self.lessons = lessons
+        self.events = events
+
+
+class FakeState:
+    """
+    the state of the fake websites and of the fake telegram server
+    """
+
+    def __init__(self, config: FakeConfig):
+        self.config = config
+        self.lock = threading.Lock()
+        # orbit session id -> {'user': username, 'lessons': [lesson codes left to register]}
+        self.orbit_sessions = {}
+        # moodle session id -> the session key of the session
+        self.moodle_sessions = {}
+        self.requests = defaultdict(int)
+        # request name -> time.perf_counter() of the first request
+        self.first_request = {}
+
+        self.updates = []
+        self.updates_changed = threading.Condition()
+        # (url, secret token) of the webhook of the bot, None while the bot polls getUpdates
+        self.webhook = None
+        self.webhook_updates = queue.Queue()
+        self.webhook_connections = 0
+        # the number of updates the bot confirmed (by the offset of getUpdates, or by the response of the webhook)
+        self.delivered = 0
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        # chat id -> queue of (time, method, parameters) of everything the bot sent to that chat
+        self.replies = defaultdict(queue.Queue)
+
+    def count(self, name: str):
+        with self.lock:
+            self.requests[name] += 1
+            self.first_request.setdefault(name, time.perf_counter())
+
+    def push_update(self, update: dict) -> int:
+        """
+        add an update to the queue of getUpdates (or of the webhook, if the bot set one)
+        :return: the update id
+        """
+        with self.updates_changed:
+            update['update_id'] = next(self.update_ids)
+            if self.webhook:
+                self.webhook_updates.put(update)
+            else:
+                self.updates.append(update)
+                self.updates_changed.notify_all()
+        return update['update_id']
+
+    def set_webhook(self, url: Optional[str], secret_token: Optional[str] = None, max_connections: int = 40):
+        """
+        post the updates to `url` from up to `max_connections` connections at the same time (None to stop)
+        """
+        with self.updates_changed:
+            self.webhook = url and (url, secret_token)
+            while url and self.webhook_connections < max_connections:
+                self.webhook_connections += 1
+                threading.Thread(target=self.__post_updates, daemon=True).start()
+
+    def __post_updates(self):
+        connection = None
+        while True:
+            update = self.webhook_updates.get()
+            body = json.dumps(update).encode('utf-8')
+            # like telegram, a failed update is posted again
+            for _ in range(5):
+                webhook = self.webhook
+                if not webhook:
+                    # the bot went back to polling
+                    with self.updates_changed:
+                        self.updates.append(update)
+                        self.updates_changed.notify_all()
+                    break
+                url, secret_token = webhook
+                headers = {'Content-Type': 'application/json'}
+                if secret_token:
+                    headers['X-Telegram-Bot-Api-Secret-Token'] = secret_token
+                try:
+                    split = urlsplit(url)
+                    connection = connection or http.client.HTTPConnection(split.netloc, timeout=10)
+                    connection.request('POST', split.path or '/', body, headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status == 200:
+                        with self.lock:
+                            self.delivered += 1
+                        break
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = None
+                time.sleep(0.1)
+
+    def get_updates(self, offset: int, timeout: float) -> list:
+        deadline = time.monotonic() + timeout
+        with self.updates_changed:
+            updates = [update for update in self.updates if update['update_id'] >= offset]
+            self.delivered += len(self.updates) - len(updates)
+            self.updates = updates
+            while not self.updates and time.monotonic() < deadline:
+                self.updates_changed.wait(deadline - time.monotonic())
+            return self.updates[:100]
+
+    def reply(self, chat_id: int, method: str, parameters: dict):
+        self.replies[chat_id].put((time.perf_counter(), method, parameters))
+
+
+def message_update(chat_id: int, text: str) -> dict:
+    message = {'message_id': 1, 'date': int(time.time()), 'text': text,
+               'chat': {'id': chat_id, 'type': 'private'},
+               'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Student'}}
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'message': message}
+
+
+def callback_update(chat_id: int, data: str) -> dict:
+    return {'callback_query': {'id': uuid.uuid4().hex, 'chat_instance': str(chat_id), 'data': data,
+                               'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Student'},
+                               'message': {'message_id': 1, 'date': int(time.time()), 'text': 'select',
+                                           'chat': {'id': chat_id, 'type': 'private'}}}}
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeServer'
+
+    def log_message(self, *_):
+        pass
+
+    @property
+    def state(self) -> FakeState:
+        return self.server.state
+
+    def do_GET(self):
+        self.__dispatch()
+
+    def do_POST(self):
+        self.__dispatch()
+
+    def __dispatch(self):
+        url = urlsplit(self.path)
+        path = re.sub('/+', '/', url.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if path.startswith('/bot'):
+            self.__telegram(path, url.query, body)
+            return
+
+        config = self.state.config
+        time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+        self.state.count(f'{self.command} {path}')
+        if random.random() < config.error_rate:
+            self.__send(500, b'<html>Server Error</html>')
+        elif path.startswith('/hadassah/'):
+            self.__orbit(path[len('/hadassah/'):], parse_qs(body.decode('utf-8')))
+        elif path.startswith('/moodle/'):
+            self.__moodle(path[len('/moodle'):], url.query, body)
+        else:
+            self.__send(404, b'not found')
+
+    def __send(self, status: int, body: bytes, content_type: str = 'text/html; charset=utf-8', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __redirect(self, location: str, headers=()):
+        self.__send(302, b'', headers=[('Location', location), *headers])
+
+    def __page(self, text: str):
+        self.__send(200, text.encode('utf-8'))
+
+    def __cookie(self, name: str) -> Optional[str]:
+        match = re.search(f'{name}=([^;]*)', self.headers.get('Cookie', ''))
+        return match[1] if match else None
+
+    def __orbit(self, page: str, form: dict):
+        config = self.state.config
+        if page == 'Login.aspx':
+            if self.command == 'GET':
+                self.__page(orbit_pages.login_page())
+            elif form.get('edtPassword', [''])[0] == 'wrong':
+                self.__page(orbit_pages.login_page())
+            else:
+                session_id = uuid.uuid4().hex
+                with self.state.lock:
+                    self.state.orbit_sessions[session_id] = {
+                        'user': form.get('edtUsername', [''])[0],
+                        'lessons': orbit_pages.lesson_codes(config.lessons)
+                    }
+                self.__redirect('/hadassah/Main.aspx',
+                                [('Set-Cookie', f'ASP.NET_SessionId={session_id}; path=/; HttpOnly')])
+            return
+
+        session = self.state.orbit_sessions.get(self.__cookie('ASP.NET_SessionId'))
+        if session is None:
+            self.__redirect(f'/hadassah/Login.aspx?ReturnUrl=%2fhadassah%2f{page}')
+            return
+
+        if page == 'Main.aspx':
+            self.__page(orbit_pages.main_page())
+        elif page == 'Handlers/Moodle.ashx':
+            self.__page(f'<html><head><meta http-equiv="refresh" content="0;URL=\'{self.__moodle_url()}/auth/sso.php\'">'
+                        f'</head></html>')
+        elif page == 'StudentGradesList.aspx':
+            distribution = [key for key in form if key.endswith('$imgShowGradeDistribution.x')]
+            if distribution:
+                self.__page(orbit_pages.grade_distribution_page(int(re.search(r'GridRow(\d+)', distribution[0])[1])))
+                return
+            page_number = 1
+            if form.get('__EVENTARGUMENT', [''])[0].startswith('Page$'):
+                page_number = int(form['__EVENTARGUMENT'][0][len('Page$'):])
+                # the view state of a page starts with the page number
+                if not config.shared_view_state and \
+                        not form.get('__VIEWSTATE', [''])[0].startswith(f'{page_number - 1:08d}'):
+                    page_number = 1
+            self.__page(orbit_pages.grades_page(config.grade_rows, page_number, config.grade_pages))
+        elif page == 'ChartImg.axd':
+            self.__send(200, CHART_PNG, 'image/png')
+        elif page == 'StudentAssignmentTermList.aspx':
+            if any(key.endswith('$btnDownload.x') for key in form):
+                self.__send(200, FAKE_PDF, 'application/pdf')
+            else:
+                self.__page(orbit_pages.exams_page(config.exams))
+        elif page == 'StudentPeriodSchedule.aspx':
+            self.__page(orbit_pages.time_table_page(config.time_table_rows if self.command == 'POST' else 0))
+        elif page == 'CreateStudentWeeklySchedule.aspx':
+            self.__lessons(session, form)
+        elif page == 'DocumentGenerationPage.aspx':
+            if self.command == 'POST':
+                self.__send(200, FAKE_PDF, 'application/pdf')
+            else:
+                self.__page(orbit_pages.main_page())
+        elif page == 'ChangePassword.aspx':
+            self.__page(orbit_pages.main_page())
+        else:
+            self.__send(404, b'not found')
+
+    def __lessons(self, session: dict, form: dict):
+        if self.command == 'GET':
+            self.__page(orbit_pages.lessons_page([]))
+            return
+        buttons = [key for key in form if key.endswith('$btnLinkStudentToLesson.x')]
+        with self.state.lock:
+            if buttons:
+                row = int(re.search(r'GridRow(\d+)', buttons[0])[1])
+                lessons = session['lessons']
+                if row < len(lessons):
+                    code = lessons.pop(row)
+                    # every third lesson is full
+                    if sum(map(ord, code)) % 3 == 0:
+                        self.__page(orbit_pages.registration_alert_page(lessons))
+                        return
+            self.__page(orbit_pages.lessons_page(session['lessons']))
+
+    def __moodle_url(self) -> str:
+        return f'http://{self.headers["Host"]}/moodle'
+
+    def __moodle(self, page: str, query: str, body: bytes):
+        if page == '/auth/sso.php':
+            session_id = uuid.uuid4().hex
+            with self.state.lock:
+                self.state.moodle_sessions[session_id] = uuid.uuid4().hex[:10]
+            self.__redirect(f'{self.__moodle_url()}/my/', [('Set-Cookie', f'MoodleSession={session_id}; path=/')])
+            return
+        sesskey = self.state.moodle_sessions.get(self.__cookie('MoodleSession'))
+        if not sesskey:
+            self.__redirect(f'{self.__moodle_url()}/login/index.php')
+            return
+        if page in ('/my/', '/user/profile.php'):
+            self.__page(orbit_pages.moodle_page(sesskey))
+        elif page == '/lib/ajax/service.php':
+            if parse_qs(query).get('sesskey') != [sesskey]:
+                error = {'errorcode': 'invalidsesskey', 'message': 'invalid sesskey'}
+                self.__send(200, json.dumps([{'error': True, 'exception': error}]).encode('utf-8'),
+                            'application/json')
+                return
+            self.__moodle_service(json.loads(body or b'[]'))
+        else:
+            self.__send(404, b'not found')
+
+    def __moodle_service(self, calls: list):
+        responses = []
+        for call in calls:
+            if call.get('methodname') != 'core_calendar_get_action_events_by_timesort':
+                responses.append({'error': False, 'data': {}})
+                continue
+            args = call.get('args', {})
+            events = orbit_pages.moodle_events(self.state.config.events)
+            events = [event for event in events
+                      if event['timesort'] >= args.get('timesortfrom', 0)
+                      and event['timesort'] <= (args.get('timesortto') or event['timesort'])
+                      and event['id'] > (args.get('aftereventid') or 0)][:args.get('limitnum', 50)]
+            responses.append(json.loads(orbit_pages.moodle_events_response(events))[0])
+        self.__send(200, json.dumps(responses).encode('utf-8'), 'application/json')
+
+    def __telegram_parameters(self, query: str, body: bytes) -> dict:
+        content_type = self.headers.get('Content-Type', '')
+        parameters = {key: values[0] for key, values in parse_qs(query).items()}
+        if content_type.startswith('application/json'):
+            parameters.update(json.loads(body or b'{}'))
+        elif content_type.startswith('multipart/form-data'):
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+            for part in message.iter_parts():
+                if part.get_filename():
+                    parameters[part.get_param('name', header='content-disposition')] = '<file>'
+                else:
+                    parameters[part.get_param('name', header='content-disposition')] = part.get_content()
+        else:
+            parameters.update({key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()})
+        return parameters
+
+    def __telegram(self, path: str, query: str, body: bytes):
+        method = path.rsplit('/', 1)[-1]
+        parameters = self.__telegram_parameters(query, body)
+        config = self.state.config
+
+        if method == 'getUpdates':
+            self.state.count('telegram getUpdates')
+            updates = self.state.get_updates(int(parameters.get('offset') or 0), float(parameters.get('timeout') or 0))
+            self.__telegram_result(updates)
+            return
+
+        time.sleep(config.telegram_latency)
+        self.state.count(f'telegram {method}')
+        if method.startswith('send') and random.random() < config.telegram_flood_rate:
+            self.__send(429, json.dumps({'ok': False, 'error_code': 429,
+                                         'description': 'Too Many Requests: retry after 1',
+                                         'parameters': {'retry_after': 1}}).encode(), 'application/json')
+            return
+
+        chat_id = int(parameters.get('chat_id') or 0)
+        if method == 'getMe':
+            self.__telegram_result({'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot',
+                                    'can_join_groups': False, 'can_read_all_group_messages': False,
+                                    'supports_inline_queries': False})
+        elif method == 'setWebhook':
+            self.state.set_webhook(parameters['url'], parameters.get('secret_token'),
+                                   int(parameters.get('max_connections') or 40))
+            self.__telegram_result(True)
+        elif method == 'deleteWebhook':
+            self.state.set_webhook(None)
+            self.__telegram_result(True)
+        elif method in ('sendMessage', 'sendDocument', 'sendPhoto', 'editMessageReplyMarkup'):
+            self.state.reply(chat_id, method, parameters)
+            self.__telegram_result({'message_id': next(self.state.message_ids), 'date': int(time.time()),
+                                    'chat': {'id': chat_id, 'type': 'private'}, 'text': parameters.get('text', '')})
+        else:
+            # answerCallbackQuery, deleteMessage, ...
+            self.__telegram_result(True)
+
+    def __telegram_result(self, result):
+        self.__send(200, json.dumps({'ok': True, 'result': result}).encode('utf-8'), 'application/json')
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, config: FakeConfig = None):
+        super().__init__(('127.0.0.1', port), FakeHandler)
+        self.state = FakeState(config or FakeConfig())
+
+    def handle_error(self, request, client_address):
+        # the bot closes its connections in the middle of a long poll when it stops
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def environment(self) -> dict:
+        """
+        the environment variables that make the bot use this server
+        """
+        return {'ORBIT_HOST': self.url,
+                'MOODLE_URL': f'{self.url}/moodle',
+                'TELEGRAM_API_URL': f'{self.url}/bot'}
+
+    def start(self) -> 'FakeServer':
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every orbit/moodle request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='random +- seconds added to the latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='part of orbit/moodle requests that fail')
+    parser.add_argument('--telegram-latency', type=float, default=0.0)
+    parser.add_argument('--telegram-flood-rate', type=float, default=0.0, help='part of send* that get 429')
+    args = parser.parse_args()
+
+    server = FakeServer(args.port, FakeConfig(latency=args.latency,
+                                              jitter=args.jitter,
+                                              error_rate=args.error_rate,
+                                              telegram_latency=args.telegram_latency,
+                                              telegram_flood_rate=args.telegram_flood_rate))
+    for name, value in server.environment().items():
+        print(f'export {name}={value}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+end-to-end load test: N simulated chats send commands and press buttons against a real bot process,
+the bot talks to the fake orbit/moodle/telegram server (see `fake_server.py`).
+reports the throughput and the latency percentiles of every command
+
+usage: python benchmarks/load_test.py [--chats 50] [--duration 60] [--latency 0.2]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from fake_server import FakeConfig, FakeServer, message_update, callback_update
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'src')
+TOKEN = '123456:fake-token'
+
+# (name, update of the step, number of messages the bot sends back)
+SCENARIOS = [
+    [('/get_grades', lambda chat: message_update(chat, '/get_grades'), 1)],
+    [('/get_unfinished_events', lambda chat: message_update(chat, '/get_unfinished_events'), 1)],
+    [('/get_upcoming_exams', lambda chat: message_update(chat, '/get_upcoming_exams'), 1)],
+    [('/get_notebook', lambda chat: message_update(chat, '/get_notebook'), 1)],
+    [('/get_grade_distribution', lambda chat: message_update(chat, '/get_grade_distribution'), 1),
+     ('grade_distribution button', lambda chat: callback_update(chat, f'grade_distribution_1_{chat % 20}'), 2)],
+    [('/get_time_table', lambda chat: message_update(chat, '/get_time_table'), 1),
+     ('time_table button', lambda chat: callback_update(chat, 'time_table_1'), 1)],
+    [('/register_class', lambda chat: message_update(chat, '/register_class'), 1),
+     ('register_class button', lambda chat: callback_update(chat, 'register_class_A'), 1)],
+]
+
+
+def create_database(path: str, chats: int):
+    with sqlite3.connect(path) as con:
+        con.execute('CREATE TABLE IF NOT EXISTS "users" ("user_id" NUMERIC, "user_name" TEXT, "password" TEXT, '
+                    '"schedule_code" INTEGER, "year" INTEGER NOT NULL DEFAULT 0)')
+        con.executemany('INSERT INTO users VALUES(?,?,?,0,0)',
+                        ((chat, f'{300000000 + chat}', 'password') for chat in range(1, chats + 1)))
+
+
+def start_bot(work_dir: str, server: FakeServer, **environment) -> subprocess.Popen:
+    """
+    :param environment: more environment variables of the bot (like TELEGRAM_WEBHOOK_URL)
+    """
+    environment = dict(os.environ, **server.environment(), PYTHONPATH=SRC, **environment)
+    return subprocess.Popen([sys.executable, '-c', f'import telegram_bot; telegram_bot.start_telegram_bot({TOKEN!r})'],
+                            cwd=work_dir, env=environment)
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.timeouts = defaultdict(int)
+
+    def add(self, name: str, latency: float = None):
+        with self.lock:
+            if latency is None:
+                self.timeouts[name] += 1
+            else:
+                self.latencies[name].append(latency)
+
+    def report(self, duration: float):
+        print(f'{"command":<28}{"count":>7}{"per sec":>9}{"p50":>9}{"p90":>9}{"p99":>9}{"max":>9}{"timeout":>9}')
+        for name in sorted(set(self.latencies) | set(self.timeouts)):
+            latencies = sorted(self.latencies[name])
+            if len(latencies) >= 2:
+                quantiles = statistics.quantiles(latencies, n=100, method='inclusive')
+                p50, p90, p99 = quantiles[49], quantiles[89], quantiles[98]
+            else:
+                p50 = p90 = p99 = latencies[0] if latencies else float('nan')
+            print(f'{name:<28}{len(latencies):>7}{len(latencies) / duration:>9.2f}'
+                  f'{p50:>9.3f}{p90:>9.3f}{p99:>9.3f}{max(latencies, default=float("nan")):>9.3f}'
+                  f'{self.timeouts[name]:>9}')
+
+
+def chat_loop(server: FakeServer, chat_id: int, end_time: float, think_time: float, timeout: float,
+              results: Results, scenarios: list = None):
+    replies = server.state.replies[chat_id]
+    while time.monotonic() < end_time:
+        for name, update, expected_replies in random.choice(scenarios or SCENARIOS):
+            while not replies.empty():
+                replies.get_nowait()
+            start = time.perf_counter()
+            server.state.push_update(update(chat_id))
+            try:
+                for _ in range(expected_replies):
+                    reply_time, _, _ = replies.get(timeout=timeout)
+            except Exception:
+                results.add(name)
+                break
+            results.add(name, reply_time - start)
+        time.sleep(random.uniform(0, 2 * think_time))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=50, help='number of simulated chats')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run')
+    parser.add_argument('--think-time', type=float, default=1, help='average seconds between scenarios of a chat')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds to wait for a reply')
+    parser.add_argument('--latency', type=float, default=0.1, help='seconds added to every orbit/moodle request')
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-flood-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = FakeServer(config=FakeConfig(latency=args.latency,
+                                          jitter=args.jitter,
+                                          error_rate=args.error_rate,
+                                          telegram_flood_rate=args.telegram_flood_rate)).start()
+    work_dir = tempfile.mkdtemp()
+    create_database(os.path.join(work_dir, 'database.db'), args.chats)
+    shutil.copy(os.path.join(SRC, 'david.ttf'), work_dir)
+    bot = start_bot(work_dir, server)
+    try:
+        results = Results()
+        start = time.monotonic()
+        end_time = start + args.duration
+        chats = [threading.Thread(target=chat_loop,
+                                  args=(server, chat_id, end_time, args.think_time, args.timeout, results))
+                 for chat_id in range(1, args.chats + 1)]
+        for chat in chats:
+            chat.start()
+        for chat in chats:
+            chat.join()
+        results.report(time.monotonic() - start)
+        print(f'\n{sum(server.state.requests[name] for name in server.state.requests if not name.startswith("telegram"))}'
+              f' orbit/moodle requests')
+    finally:
+        bot.terminate()
+        bot.wait()
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
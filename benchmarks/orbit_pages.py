@@ -0,0 +1,183 @@
+"""
+synthetic orbit and moodle pages, in the same structure the parsers in `src/parsers.py` expect
+"""
+import json
+import re
+from datetime import datetime, timedelta
+
+DAYS = ["א'", "ב'", "ג'", "ד'", "ה'", "ו'"]
+YEARS = list(range(2018, 2024))
+
+
+def hidden_inputs(view_state_size: int = 20_000, seed: int = 0) -> str:
+    view_state = (f'{seed:08d}' + 'A' * 55 + '/') * (view_state_size // 64)
+    return (f'<input type="hidden" name="__VIEWSTATE" id="__VIEWSTATE" value="{view_state}" />\n'
+            f'<input type="hidden" name="__VIEWSTATEGENERATOR" id="__VIEWSTATEGENERATOR" value="CA0B0334" />\n'
+            f'<input type="hidden" name="__EVENTVALIDATION" id="__EVENTVALIDATION" value="{view_state[:2048]}" />\n')
+
+
+def years_select(selected: int = YEARS[-1]) -> str:
+    options = ''.join(f'<option selected="selected" value="{year}">{year}</option>' if year == selected else
+                      f'<option value="{year}">{year}</option>' for year in YEARS)
+    return f'<select name="ctl00$cmbActiveYear" id="cmbActiveYear">{options}</select>'
+
+
+def page(body: str, view_state_size: int = 20_000, seed: int = 0) -> str:
+    return (f'<!DOCTYPE html><html dir="rtl"><head><meta charset="utf-8" /></head><body>'
+            f'<form method="post" id="form1">{hidden_inputs(view_state_size, seed)}{years_select()}'
+            f'{body}</form></body></html>')
+
+
+def login_page() -> str:
+    return page('<input name="edtUsername" type="text" /><input name="edtPassword" type="password" />'
+                '<input type="submit" name="btnLogin" value="כניסה" />', view_state_size=2_000)
+
+
+def main_page() -> str:
+    return page('<div>ברוכים הבאים</div>')
+
+
+def grade_row(index: int, row: int) -> str:
+    return (f'<tr id="ContentPlaceHolder1_gvGradesList" class="GridRow">'
+            f'<td>{YEARS[-1]}</td>'
+            f'<td>קורס מספר {index} &amp; מעבדה</td>'
+            f'<td>{10000 + index}</td>'
+            f'<td>סמסטר א\'</td>'
+            f'<td>{index % 5 + 1}</td>'
+            f'<td>בחינה</td>'
+            f'<td><span id="ContentPlaceHolder1_gvGradesList_lblGrade_{row}">{60 + index % 41}</span>'
+            f'<input type="image" name="ctl00$ContentPlaceHolder1$gvGradesList$GridRow{row}$imgShowGradeDistribution"'
+            f' src="images/chart.png" /></td>'
+            f'</tr>\n')
+
+
+def grades_page(rows: int, page_number: int = 1, pages: int = 1, rows_per_page: int = None) -> str:
+    """
+    one page of the grades list
+    :param rows: the number of rows in this page
+    :param page_number: the number of this page
+    :param pages: the number of pages in the list
+    :param rows_per_page: the number of rows in the previous pages (default `rows`)
+    """
+    first = (page_number - 1) * (rows_per_page or rows)
+    pager = ''.join(f'<td><span>{number}</span></td>' if number == page_number else
+                    f'<td><a href="javascript:__doPostBack(&#39;ctl00$ContentPlaceHolder1$gvGradesList&#39;,'
+                    f'&#39;Page${number}&#39;)">{number}</a></td>' for number in range(1, pages + 1))
+    grid = ''.join(grade_row(first + row, row) for row in range(rows))
+    return page(f'<table id="ContentPlaceHolder1_gvGradesList">{grid}<tr class="GridPager">{pager}</tr></table>',
+                seed=page_number)
+
+
+def grade_distribution_page(row: int = 0) -> str:
+    return page(f'<span id="ContentPlaceHolder1_ucLessonGradeDistribution_lblStatData"><table>'
+                f'<tr><td>ציונך</td><td>{80 + row % 20}</td></tr>'
+                f'<tr><td>ממוצע</td><td>78.5</td></tr>'
+                f'<tr><td>ס.ת</td><td>9.2</td></tr>'
+                f'<tr><td>דירוג</td><td>{row + 3}</td></tr>'
+                f'</table></span>'
+                f'<img src="/hadassah/ChartImg.axd?i=chart_{row}.png&amp;g=0123456789" alt="" />')
+
+
+def exam_row(index: int, start: datetime) -> str:
+    day = start + timedelta(days=index * 3)
+    prefix = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}'
+    register = f'<input type="submit" name="{prefix}$btnRequestExamAssign" value="רישום" />' if index % 3 == 0 else \
+        f'<input type="submit" name="{prefix}$btnRequestExamAssignCancel" value="ביטול" />' if index % 3 == 1 else ''
+    download = f'<input type="image" name="{prefix}$btnDownload" src="pdf.png" />' if index % 2 else '&nbsp;'
+    return (f'<tr id="ContentPlaceHolder1_gvStudentAssignmentTermList" class="GridRow">'
+            f'<td>{day:%d/%m/%Y}</td>'
+            f'<td>{DAYS[index % 6]}</td>'
+            f'<td><span id="time{index}">09:00-12:00</span></td>'
+            f'<td>בחינה</td>'
+            f'<td>מועד {"אב"[index % 2]}</td>'
+            f'<td>{"&nbsp;" if index % 4 else 85}</td>'
+            f'<td>&nbsp;</td>'
+            f'<td>{"&nbsp;" if index % 5 else "כיתה 101"}</td>'
+            f'<td>&nbsp;</td>'
+            f'<td>{10000 + index}</td>'
+            f'<td>קורס מספר {index}</td>'
+            f'<td>&nbsp;</td>'
+            f'<td>{register}</td>'
+            f'<td>{download}</td>'
+            f'</tr>\n')
+
+
+def exams_page(rows: int) -> str:
+    # a third of the exams are still ahead
+    start = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=rows * 2)
+    grid = ''.join(exam_row(index, start) for index in range(rows))
+    return page(f'<table id="ContentPlaceHolder1_gvStudentAssignmentTermList">{grid}</table>')
+
+
+def time_table_row(index: int) -> str:
+    start = 8 + index % 10
+    return (f'<tr id="ContentPlaceHolder1_PeriodScheduleA_gvPeriodSchedule" class="GridRow">'
+            f'<td>{DAYS[index % 5]}</td>'
+            f'<td>{start:02d}:30-{start + 1:02d}:15</td>'
+            f'<td>קורס מספר {index}<br>{10000 + index}</td>'
+            f'<td>הרצאה</td><td>&nbsp;</td><td>&nbsp;</td><td>&nbsp;</td><td>&nbsp;</td>'
+            f'<td>ד"ר מרצה {index % 7}</td>'
+            f'<td>{"&nbsp;" if index % 4 == 3 else f"כיתה {100 + index}"}</td>'
+            f'</tr>\n')
+
+
+def time_table_page(rows: int) -> str:
+    grid = ''.join(time_table_row(index) for index in range(rows))
+    return page(f'<table id="ContentPlaceHolder1_PeriodScheduleA_gvPeriodSchedule">{grid}</table>')
+
+
+def lesson_row(row: int, code: str) -> str:
+    return (f'<tr class="GridRow"><td>'
+            f'<input type="image" name="ctl00$ContentPlaceHolder1$gvLinkToLessons$GridRow{row}$btnLinkStudentToLesson"'
+            f' src="add.png" /></td>'
+            f'<td><span id="lblLesson{row}"><table><tr><td>קורס {code}</td></tr></table></span></td>'
+            f'<td valign="top" nowrap="nowrap"><span id="lblCode{row}">{code}</span></td></tr>\n')
+
+
+def lesson_codes(lessons: int, classes: int = 4):
+    return [f'{10000 + index // classes}-{index % 3 + 1}-{chr(ord("A") + index % classes)}'
+            for index in range(lessons)]
+
+
+def lessons_page(codes) -> str:
+    balance = ''.join(f'<input type="image" name="ctl00$ContentPlaceHolder1$gvBalance$GridRow{row}'
+                      f'$btnBalanceDataDetails" src="details.png" />' for row in range(len(YEARS)))
+    grid = ''.join(lesson_row(row, code) for row, code in enumerate(codes))
+    return page(f'<table id="gvBalance">{balance}</table><table id="gvLinkToLessons">{grid}</table>')
+
+
+def registration_alert_page(codes) -> str:
+    return lessons_page(codes).replace('</form>', '<script>function OLScriptCounter1alert() '
+                                                  '{ window.alert("שגיאה"); }</script></form>')
+
+
+def moodle_page(sesskey: str = 'abcdef0123') -> str:
+    return (f'<!DOCTYPE html><html><head><script>M.cfg = {{"wwwroot":"https://mowgli.hac.ac.il",'
+            f'"sesskey":"{sesskey}","themerev":"1"}};</script></head><body>לוח בקרה</body></html>')
+
+
+def moodle_events(count: int, start: datetime = None, first_id: int = 1) -> list:
+    start = start or datetime.now()
+    return [{'id': first_id + index,
+             'name': f'מטלה {first_id + index}',
+             'course': {'shortname': f'{10000 + index % 7} - קורס {index % 7}', 'id': index % 7},
+             'timesort': int((start + timedelta(hours=5 * (index + 1))).timestamp()),
+             'url': f'https://mowgli.hac.ac.il/mod/assign/view.php?id={first_id + index}'}
+            for index in range(count)]
+
+
+def moodle_events_response(events: list) -> str:
+    return json.dumps([{'error': False,
+                        'data': {'events': events,
+                                 'firsteventid': events[0]['id'] if events else 0,
+                                 'lasteventid': events[-1]['id'] if events else 0}}])
+
+
+def enlarge(text: str, row_start: str, factor: int) -> str:
+    """
+    enlarge a recorded page by repeating all of its grid rows
+    :param text: the page
+    :param row_start: the start of the rows to repeat (like `<tr id="ContentPlaceHolder1_gvGradesList"`)
+    :param factor: how many times to repeat every row
+    """
+    return re.sub(f'{re.escape(row_start)}.*?</tr>', lambda row: row[0] * factor, text, flags=re.DOTALL)
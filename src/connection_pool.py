@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+from typing import Iterable, Optional
+
+import httpx
+
+# the keep-alive connections to orbit and moodle are shared by the sessions of all the users
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '100'))
+# an idle connection is closed after that many seconds
+HTTP_KEEPALIVE_SECONDS = float(os.environ.get('HTTP_KEEPALIVE_SECONDS', '30'))
+# the number of connections to every host that are opened when the bot starts (0 to not open any)
+HTTP_WARM_UP_CONNECTIONS = int(os.environ.get('HTTP_WARM_UP_CONNECTIONS', '0'))
+
+logger = logging.getLogger(__name__)
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    transport for all the `httpx.AsyncClient`s of the process, every client keeps its own cookies
+    but the connections (and their TLS sessions) are taken from one pool.
+    closing a client does not close the pool, `close` does (and the pool is opened again on the next request)
+    """
+
+    def __init__(self, max_connections: int = HTTP_POOL_SIZE, keepalive_expiry: float = HTTP_KEEPALIVE_SECONDS):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.__transport: Optional[httpx.AsyncHTTPTransport] = None
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self.__transport:
+            self.__transport = httpx.AsyncHTTPTransport(limits=self.limits)
+        return await self.__transport.handle_async_request(request)
+
+    async def aclose(self):
+        # called by every client that is closed, the pool is shared
+        pass
+
+    async def close(self):
+        """
+        close all the connections of the pool
+        """
+        transport, self.__transport = self.__transport, None
+        if transport:
+            await transport.aclose()
+
+    async def warm_up(self, urls: Iterable[str], connections: int):
+        """
+        open connections before they are needed, so the first commands do not wait for the TLS handshakes
+        :param urls: a cheap page of every host
+        :param connections: the number of connections to open to every host
+        :return:
+        """
+        async def head(client: httpx.AsyncClient, url: str):
+            try:
+                await client.head(url)
+            except httpx.HTTPError as error:
+                logger.warning('warm up of %s failed: %s', url, error)
+
+        # the requests are sent at the same time, so every one of them opens its own connection
+        async with httpx.AsyncClient(transport=self) as client:
+            await asyncio.gather(*[head(client, url) for url in urls for _ in range(connections)])
+
+
+transport = SharedTransport()
@@ -1,48 +1,154 @@
+import os
 import sqlite3
+import threading
+import time
 from collections import namedtuple
-from typing import Iterator
+from typing import Iterator, Iterable, List, Optional, Sequence
+
+import tracing
 
 DATABASE = 'database.db'
 TABLE = 'users'
+COOKIES_TABLE = 'cookies'
+GRADE_SNAPSHOTS_TABLE = 'grade_snapshots'
+GRADE_DISTRIBUTIONS_TABLE = 'grade_distributions'
+LEASES_TABLE = 'scheduler_leases'
 
 User = namedtuple('User', 'user_id user_name password schedule_code, year')
+Cookie = namedtuple('Cookie', 'domain name value path expires')
+GradeSnapshot = namedtuple('GradeSnapshot', 'grades_hash grades checked_at login_failed')
+CachedGradeDistribution = namedtuple('CachedGradeDistribution', 'grade average standard_deviation position image')
+# the users of shard `index` (out of `count` shards) are the users whose user_id modulo count is index
+# (the non-negative modulo, so the group chats, whose ids are negative, have a shard too)
+Shard = namedtuple('Shard', 'index count')
+
+# seconds to wait for a lock of another connection
+BUSY_TIMEOUT = 10
+# the number of prepared statements kept by every connection
+CACHED_STATEMENTS = 256
+
+# the number of users read from the database in one query by `iter_users`
+USERS_BATCH_SIZE = 500
+
+# every migration is a list of statements, the number of migrations that ran is kept in `PRAGMA user_version`
+MIGRATIONS = [
+    [f'CREATE TABLE IF NOT EXISTS {TABLE} ('
+     f'"user_id" NUMERIC, "user_name" TEXT, "password" TEXT, "schedule_code" INTEGER, '
+     f'"year" INTEGER NOT NULL DEFAULT 0)',
+     f'CREATE TABLE IF NOT EXISTS {COOKIES_TABLE} ('
+     f'user_id NUMERIC, domain TEXT, name TEXT, value TEXT, path TEXT, expires INTEGER)',
+     f'CREATE TABLE IF NOT EXISTS {GRADE_SNAPSHOTS_TABLE} ('
+     f'user_id NUMERIC PRIMARY KEY, grades_hash TEXT, grades TEXT, checked_at INTEGER)',
+     f'CREATE TABLE IF NOT EXISTS {GRADE_DISTRIBUTIONS_TABLE} ('
+     f'user_id NUMERIC, year INTEGER, grade_row TEXT, grade TEXT, average TEXT, standard_deviation TEXT, '
+     f'position TEXT, image BLOB, cached_at INTEGER, PRIMARY KEY (user_id, year, grade_row))'],
+    # keep only the last row of every user (add_user used to delete and insert in two transactions)
+    [f'DELETE FROM {TABLE} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {TABLE} GROUP BY user_id)',
+     f'CREATE UNIQUE INDEX IF NOT EXISTS {TABLE}_user_id ON {TABLE} (user_id)',
+     f'CREATE INDEX IF NOT EXISTS {TABLE}_schedule_code ON {TABLE} (schedule_code)',
+     f'CREATE INDEX IF NOT EXISTS {COOKIES_TABLE}_user_id ON {COOKIES_TABLE} (user_id)'],
+    # the users of a schedule are read in batches by the order of user_id
+    [f'DROP INDEX IF EXISTS {TABLE}_schedule_code',
+     f'CREATE INDEX IF NOT EXISTS {TABLE}_schedule_code_user_id ON {TABLE} (schedule_code, user_id)'],
+    # every run of a scheduled job is split to shards, a shard is leased by the worker that runs it
+    [f'CREATE TABLE IF NOT EXISTS {LEASES_TABLE} ('
+     f'job TEXT, run INTEGER, shard INTEGER, shards INTEGER, owner TEXT, heartbeat INTEGER, '
+     f'done INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (job, run, shard))'],
+    # the cookies are of the login of the user, they are not used after the username or the year changed
+    [f'ALTER TABLE {COOKIES_TABLE} ADD COLUMN user_name TEXT',
+     f'ALTER TABLE {COOKIES_TABLE} ADD COLUMN year INTEGER',
+     f'DELETE FROM {COOKIES_TABLE}'],
+    # the grades of a user whose login failed are not checked until the user logs in again
+    [f'ALTER TABLE {GRADE_SNAPSHOTS_TABLE} ADD COLUMN login_failed INTEGER NOT NULL DEFAULT 0'],
+]
+
+# every thread has its own connection, it is opened on the first use and kept open
+_local = threading.local()
+
+
+def _connect() -> sqlite3.Connection:
+    """
+    get the connection of this thread to DATABASE
+    (use it with `with` to commit or rollback the statements as one transaction)
+    :return: the connection
+    """
+    # a forked process can not use the connection of its parent
+    key = (os.getpid(), DATABASE)
+    if getattr(_local, 'key', None) != key:
+        con = sqlite3.connect(DATABASE, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS)
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA synchronous=NORMAL')
+        _migrate(con)
+        _local.connection, _local.key = con, key
+    return _local.connection
+
+
+def _migrate(con: sqlite3.Connection):
+    """
+    run the migrations that did not run yet on the database
+    :param con:
+    :return:
+    """
+    if con.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRATIONS):
+        return
+    with con:
+        # lock the database, so only one process migrates it
+        con.execute('BEGIN IMMEDIATE')
+        version = con.execute('PRAGMA user_version').fetchone()[0]
+        for migration in MIGRATIONS[version:]:
+            for statement in migration:
+                con.execute(statement)
+        con.execute(f'PRAGMA user_version = {len(MIGRATIONS)}')
 
 
+@tracing.traced
 def add_user(user_id: int, user_name: str, password: str):
     """
     adds a row to TABLE with the parameters
-    if exist user_id, remove that row
+    if exist user_id, the row is replaced (and the saved data of the old user is deleted)
     :param user_id:
     :param user_name:
     :param password:
     :return:
     """
-    # delete if exist
-    delete_user(user_id)
-
-    with sqlite3.connect(DATABASE) as con:
-        curses = con.cursor()
-        curses.execute(f'INSERT INTO {TABLE} VALUES(?,?,?,0,0)', (user_id, user_name, password))
+    with _connect() as con:
+        con.execute(f'INSERT INTO {TABLE} VALUES(?,?,?,0,0) ON CONFLICT(user_id) DO UPDATE SET '
+                    f'user_name=excluded.user_name, password=excluded.password, schedule_code=0, year=0',
+                    (user_id, user_name, password))
+        _delete_user_data(con, user_id)
 
 
+@tracing.traced
 def delete_user(user_id: int):
     """
     delete a user by its id
     :param user_id:
     :return:
     """
-    with sqlite3.connect(DATABASE) as con:
-        handle = con.cursor()
-        handle.execute(f'DELETE FROM {TABLE} WHERE user_id = ?', (user_id,))
+    with _connect() as con:
+        con.execute(f'DELETE FROM {TABLE} WHERE user_id = ?', (user_id,))
+        _delete_user_data(con, user_id)
 
 
+def _delete_user_data(con: sqlite3.Connection, user_id: int):
+    """
+    delete the saved sessions, grades snapshot and grade distributions of a user (in the transaction of `con`)
+    :param con:
+    :param user_id:
+    :return:
+    """
+    for table in (COOKIES_TABLE, GRADE_SNAPSHOTS_TABLE, GRADE_DISTRIBUTIONS_TABLE):
+        con.execute(f'DELETE FROM {table} WHERE user_id = ?', (user_id,))
+
+
+@tracing.traced
 def get_user_by_id(user_id: int) -> User:
     """
     gets the row of a user by id
     :param user_id:
     :return: the row as a tuple
     """
-    with sqlite3.connect(DATABASE) as con:
+    with _connect() as con:
         handle = con.cursor()
         user_row = handle.execute(f'SELECT * FROM {TABLE} WHERE user_id=?', (user_id,))
         user = user_row.fetchone()
@@ -52,15 +158,106 @@ def get_user_by_id(user_id: int) -> User:
         return User(*user)
 
 
-def get_all_users() -> Iterator[User]:
+def get_all_users(shard: Optional[Shard] = None) -> Iterator[User]:
     """
-    :return: all the TABLE as sqlite3 object
+    :param shard: only the users of that shard (None for all the users)
+    :return: iterator of all the users (see `iter_users`)
     """
-    with sqlite3.connect(DATABASE) as con:
-        handle = con.cursor()
-        return (User(*user) for user in handle.execute(f'SELECT * FROM {TABLE}'))
+    return iter_users(shard=shard)
 
 
+def iter_users(schedule_code: Optional[int] = None,
+               columns: Sequence[str] = User._fields,
+               batch_size: int = USERS_BATCH_SIZE,
+               shard: Optional[Shard] = None) -> Iterator[tuple]:
+    """
+    stream the users by the order of user_id, in batches of `batch_size` users.
+    every batch is a separate query (the next batch starts after the last user_id of the previous one),
+    so no statement (and no read transaction) is left open while the users are handled
+    :param schedule_code: only the users with that schedule code (None for all the users)
+    :param shard: only the users of that shard (None for all the users)
+    :param columns: the columns to select, must include user_id
+    :param batch_size:
+    :return: iterator of User if all the columns are selected, otherwise iterator of namedtuples of the columns
+    """
+    columns = tuple(columns)
+    if 'user_id' not in columns or not set(columns) <= set(User._fields):
+        raise ValueError(f'columns must be fields of User including user_id, not {columns}')
+    row_type = User if columns == User._fields else namedtuple('UserColumns', columns)
+    user_id_index = columns.index('user_id')
+
+    conditions = [] if schedule_code is None else ['schedule_code = ?']
+    parameters = [] if schedule_code is None else [schedule_code]
+    if shard is not None and shard.count > 1:
+        conditions.append(_shard_condition('user_id'))
+        parameters += [shard.count, shard.count, shard.count, shard.index]
+    yield from _iter_batches(f'SELECT {", ".join(columns)} FROM {TABLE}', 'user_id', conditions, parameters,
+                             batch_size, row_type, user_id_index)
+
+
+def iter_due_grade_users(checked_before: int,
+                         batch_size: int = USERS_BATCH_SIZE,
+                         shard: Optional[Shard] = None) -> Iterator[User]:
+    """
+    stream the users whose grades should be checked (like `iter_users`): the users with a grade snapshot
+    that was checked before `checked_before` and whose last check did not fail on the login
+    :param checked_before: seconds since the epoch
+    :param batch_size:
+    :param shard: only the users of that shard (None for all the users)
+    :return: iterator of the users
+    """
+    conditions = [f'{GRADE_SNAPSHOTS_TABLE}.login_failed = 0', f'{GRADE_SNAPSHOTS_TABLE}.checked_at <= ?']
+    parameters = [checked_before]
+    if shard is not None and shard.count > 1:
+        conditions.append(_shard_condition(f'{TABLE}.user_id'))
+        parameters += [shard.count, shard.count, shard.count, shard.index]
+    columns = ', '.join(f'{TABLE}.{column}' for column in User._fields)
+    yield from _iter_batches(f'SELECT {columns} FROM {TABLE} JOIN {GRADE_SNAPSHOTS_TABLE} '
+                             f'ON {GRADE_SNAPSHOTS_TABLE}.user_id = {TABLE}.user_id', f'{TABLE}.user_id',
+                             conditions, parameters, batch_size, User, User._fields.index('user_id'))
+
+
+def _shard_condition(user_id_column: str) -> str:
+    """
+    :param user_id_column:
+    :return: the condition of the users of a shard, with the parameters (count, count, count, index)
+    """
+    # the % of sqlite keeps the sign of user_id
+    return f'(({user_id_column} % ?) + ?) % ? = ?'
+
+
+def _iter_batches(select: str, user_id_column: str, conditions: List[str], parameters: list, batch_size: int,
+                  row_type, user_id_index: int) -> Iterator[tuple]:
+    """
+    run `select` in batches of `batch_size` rows by the order of user_id (see `iter_users`)
+    :param select: the select statement without the where
+    :param user_id_column: the user_id column the rows are ordered by
+    :param conditions: the conditions of the where
+    :param parameters: the parameters of the conditions
+    :param batch_size:
+    :param row_type: namedtuple of the selected columns
+    :param user_id_index: the index of the user_id in the selected columns
+    :return: iterator of `row_type`
+    """
+    last_user_id = None
+    while True:
+        if last_user_id is None:
+            where = conditions
+            values = parameters
+        else:
+            where = conditions + [f'{user_id_column} > ?']
+            values = parameters + [last_user_id]
+        where = f' WHERE {" AND ".join(where)}' if where else ''
+        with _connect() as con:
+            rows = con.execute(f'{select}{where} ORDER BY {user_id_column} LIMIT ?',
+                               (*values, batch_size)).fetchall()
+        yield from map(row_type._make, rows)
+        if len(rows) < batch_size:
+            return
+        last_user_id = rows[-1][user_id_index]
+
+
+@tracing.traced
 def update_schedule(user_id: int, schedule_code: int):
     """
     updates the schedule_code field in a given user
@@ -68,11 +265,12 @@ def update_schedule(user_id: int, schedule_code: int):
     :param schedule_code:
     :return:
     """
-    with sqlite3.connect(DATABASE) as con:
+    with _connect() as con:
         curses = con.cursor()
         curses.execute(f'UPDATE {TABLE} SET schedule_code =? WHERE user_id=? ', (schedule_code, user_id))
 
 
+@tracing.traced
 def update_year(user_id: int, year: int):
     """
     updates the year field in a given user
@@ -80,19 +278,218 @@ def update_year(user_id: int, year: int):
     :param year:
     :return:
     """
-    with sqlite3.connect(DATABASE) as con:
-        curses = con.cursor()
-        curses.execute(f'UPDATE {TABLE} SET year =? WHERE user_id=? ', (year, user_id))
+    with _connect() as con:
+        con.execute(f'UPDATE {TABLE} SET year =? WHERE user_id=? ', (year, user_id))
+        # the year is part of the orbit session, the saved session is no longer valid
+        con.execute(f'DELETE FROM {COOKIES_TABLE} WHERE user_id = ?', (user_id,))
+        # the grades of the new year are not new grades
+        con.execute(f'DELETE FROM {GRADE_SNAPSHOTS_TABLE} WHERE user_id = ?', (user_id,))
 
 
-def get_users_by_schedule(schedule_code: int) -> Iterator[User]:
+def get_users_by_schedule(schedule_code: int, shard: Optional[Shard] = None) -> Iterator[User]:
     """
 
     :param schedule_code:
+    :param shard: only the users of that shard (None for all the users)
+    :return: iterator of the users with that schedule code (see `iter_users`)
+    """
+    return iter_users(schedule_code, shard=shard)
+
+
+@tracing.traced
+def save_cookies(user_id: int, user_name: str, year: int, cookies: Iterable[Cookie]):
+    """
+    replace the saved cookies of a user
+    :param user_id:
+    :param user_name: the username the cookies were logged in with
+    :param year: the year the cookies were logged in with
+    :param cookies:
     :return:
     """
-    with sqlite3.connect(DATABASE) as con:
+    with _connect() as con:
+        curses = con.cursor()
+        curses.execute(f'DELETE FROM {COOKIES_TABLE} WHERE user_id = ?', (user_id,))
+        curses.executemany(f'INSERT INTO {COOKIES_TABLE} '
+                           f'(user_id, domain, name, value, path, expires, user_name, year) VALUES(?,?,?,?,?,?,?,?)',
+                           ((user_id, *cookie, user_name, year) for cookie in cookies))
+
+
+@tracing.traced
+def get_cookies(user_id: int, user_name: str, year: int) -> List[Cookie]:
+    """
+    gets the saved cookies of a user that are not expired yet
+    :param user_id:
+    :param user_name: cookies that were logged in with another username are ignored
+    :param year: cookies that were logged in with another year are ignored
+    :return: list of the cookies
+    """
+    with _connect() as con:
+        handle = con.cursor()
+        rows = handle.execute(f'SELECT domain, name, value, path, expires FROM {COOKIES_TABLE} '
+                              f'WHERE user_id=? AND user_name=? AND year=? AND expires > ?',
+                              (user_id, user_name, year, int(time.time())))
+        return [Cookie(*cookie) for cookie in rows]
+
+
+@tracing.traced
+def save_grade_snapshot(user_id: int, grades_hash: Optional[str], grades: Optional[str], checked_at: int,
+                        login_failed: bool = False):
+    """
+    replace the grade snapshot of a user
+    :param user_id:
+    :param grades_hash: the hash of `grades` (None if the grades are unknown)
+    :param grades: the grades as json (None if the grades are unknown)
+    :param checked_at: the time (in seconds since the epoch) the grades were checked
+    :param login_failed: did the check fail because the password of the user is wrong or expired
+    :return:
+    """
+    with _connect() as con:
+        curses = con.cursor()
+        curses.execute(f'INSERT OR REPLACE INTO {GRADE_SNAPSHOTS_TABLE} VALUES(?,?,?,?,?)',
+                       (user_id, grades_hash, grades, checked_at, int(login_failed)))
+
+
+@tracing.traced
+def get_grade_snapshot(user_id: int) -> Optional[GradeSnapshot]:
+    """
+    gets the grade snapshot of a user
+    :param user_id:
+    :return: the snapshot, None if the grades of the user were never checked
+    """
+    with _connect() as con:
+        handle = con.cursor()
+        snapshot = handle.execute(f'SELECT grades_hash, grades, checked_at, login_failed '
+                                  f'FROM {GRADE_SNAPSHOTS_TABLE} WHERE user_id=?', (user_id,)).fetchone()
+        return snapshot and GradeSnapshot(*snapshot)
+
+
+@tracing.traced
+def save_grade_distribution(user_id: int, year: int, grade_row: str, distribution: CachedGradeDistribution,
+                            cached_at: int):
+    """
+    save the grade distribution of a subject
+    :param user_id:
+    :param year: the year of the user
+    :param grade_row: the `internet.grade_distribution_key` of the subject (its row in orbit and its name)
+    :param distribution:
+    :param cached_at: the time (in seconds since the epoch) the distribution was taken from orbit
+    :return:
+    """
+    with _connect() as con:
+        curses = con.cursor()
+        curses.execute(f'INSERT OR REPLACE INTO {GRADE_DISTRIBUTIONS_TABLE} VALUES(?,?,?,?,?,?,?,?,?)',
+                       (user_id, year, grade_row, *distribution, cached_at))
+
+
+@tracing.traced
+def get_grade_distribution(user_id: int, year: int, grade_row: str,
+                           cached_after: int) -> Optional[CachedGradeDistribution]:
+    """
+    gets a saved grade distribution of a subject
+    :param user_id:
+    :param year: the year of the user
+    :param grade_row: the `internet.grade_distribution_key` of the subject (its row in orbit and its name)
+    :param cached_after: older distributions are ignored (seconds since the epoch)
+    :return: the distribution, None if there is no such distribution
+    """
+    with _connect() as con:
         handle = con.cursor()
+        distribution = handle.execute(f'SELECT grade, average, standard_deviation, position, image '
+                                      f'FROM {GRADE_DISTRIBUTIONS_TABLE} '
+                                      f'WHERE user_id=? AND year=? AND grade_row=? AND cached_at > ?',
+                                      (user_id, year, grade_row, cached_after)).fetchone()
+        return distribution and CachedGradeDistribution(*distribution)
+
 
-        return (User(*user) for user in
-                handle.execute(f'SELECT * FROM {TABLE} WHERE schedule_code=?', (schedule_code,)))
+@tracing.traced
+def delete_grade_distributions(user_id: int):
+    """
+    delete all the saved grade distributions of a user
+    :param user_id:
+    :return:
+    """
+    with _connect() as con:
+        handle = con.cursor()
+        handle.execute(f'DELETE FROM {GRADE_DISTRIBUTIONS_TABLE} WHERE user_id = ?', (user_id,))
+
+
+@tracing.traced
+def claim_shard(job: str, run: int, shards: int, owner: str, lease_seconds: int) -> Optional[Shard]:
+    """
+    lease a shard of a run of a job that is not done and is not leased by a live worker.
+    the first worker of a run creates its shards (and deletes the older runs of the job that no live worker runs
+    a shard of), the other workers use the number of shards of the run even if it is not `shards`.
+    a run that is older than the newest run of the job is not created (or leased) again
+    :param job: the name of the job
+    :param run: the number of the run (the same in all the workers)
+    :param shards: the number of shards of a new run
+    :param owner: the name of the worker
+    :param lease_seconds: a shard whose heartbeat is older than that is taken from its owner
+    :return: the leased shard, None if there is no shard to lease
+    """
+    now = int(time.time())
+    con = _connect()
+    with con:
+        # lock the database, so two workers can not lease the same shard
+        con.execute('BEGIN IMMEDIATE')
+        newest_run = con.execute(f'SELECT MAX(run) FROM {LEASES_TABLE} WHERE job=?', (job,)).fetchone()[0]
+        if newest_run is not None and run < newest_run:
+            return None
+        if newest_run != run:
+            con.execute(f'DELETE FROM {LEASES_TABLE} WHERE job=? AND run<? AND run NOT IN ('
+                        f'SELECT run FROM {LEASES_TABLE} WHERE job=? AND done=0 AND owner IS NOT NULL '
+                        f'AND heartbeat >= ?)', (job, run, job, now - lease_seconds))
+            con.executemany(f'INSERT INTO {LEASES_TABLE} VALUES(?,?,?,?,NULL,NULL,0)',
+                            ((job, run, shard, shards) for shard in range(shards)))
+        row = con.execute(f'SELECT shard, shards FROM {LEASES_TABLE} '
+                          f'WHERE job=? AND run=? AND done=0 AND (owner IS NULL OR heartbeat < ?) '
+                          f'ORDER BY shard LIMIT 1', (job, run, now - lease_seconds)).fetchone()
+        if not row:
+            return None
+        con.execute(f'UPDATE {LEASES_TABLE} SET owner=?, heartbeat=? WHERE job=? AND run=? AND shard=?',
+                    (owner, now, job, run, row[0]))
+        return Shard(*row)
+
+
+@tracing.traced
+def renew_lease(job: str, run: int, shard: Shard, owner: str) -> bool:
+    """
+    update the heartbeat of a leased shard
+    :param job:
+    :param run:
+    :param shard:
+    :param owner:
+    :return: is the shard still leased by `owner`
+    """
+    with _connect() as con:
+        return con.execute(f'UPDATE {LEASES_TABLE} SET heartbeat=? WHERE job=? AND run=? AND shard=? AND owner=?',
+                           (int(time.time()), job, run, shard.index, owner)).rowcount == 1
+
+
+@tracing.traced
+def finish_shard(job: str, run: int, shard: Shard, owner: str) -> bool:
+    """
+    mark a leased shard as done
+    :param job:
+    :param run:
+    :param shard:
+    :param owner:
+    :return: was the shard still leased by `owner`
+    """
+    with _connect() as con:
+        return con.execute(f'UPDATE {LEASES_TABLE} SET done=1 WHERE job=? AND run=? AND shard=? AND owner=?',
+                           (job, run, shard.index, owner)).rowcount == 1
+
+
+@tracing.traced
+def unfinished_shards(job: str, run: int) -> int:
+    """
+    :param job:
+    :param run:
+    :return: the number of shards of the run that are not done (0 if a newer run of the job started,
+    the shards of an older run are not leased again)
+    """
+    with _connect() as con:
+        return con.execute(f'SELECT COUNT(*) FROM {LEASES_TABLE} WHERE job=? AND run=? AND done=0 '
+                           f'AND NOT EXISTS (SELECT 1 FROM {LEASES_TABLE} WHERE job=? AND run>?)',
+                           (job, run, job, run)).fetchone()[0]
@@ -0,0 +1,48 @@
+import re
+import weakref
+from collections import namedtuple
+
+import httpx
+
+ENCODING = 'utf-8'
+
+Form = namedtuple('Form', 'hidden_inputs year')
+
+# one pass over the raw page: every hidden input and the active year <select> (the selected year is taken from it)
+__FORM_REGEX = re.compile(rb'<input type="hidden" name="([^"]*)" id="[^"]*" value="([^"]*)" />'
+                          rb'|<select name="ctl00\$cmbActiveYear"(.*?)</select', re.DOTALL)
+__SELECTED_YEAR_REGEX = re.compile(rb'<option selected="selected" value="([0-9]*)"')
+
+__forms = weakref.WeakKeyDictionary()
+
+
+def scan_form(content: bytes) -> Form:
+    """
+    get the asp.net form data of a page (__VIEWSTATE, __EVENTVALIDATION and the other hidden inputs, and the year)
+    :param content: the raw html code of the page
+    :return: Form with all the hidden inputs and their values and the selected year (None if not found)
+    """
+    hidden_inputs = {}
+    year = None
+    for match in __FORM_REGEX.finditer(content):
+        name, value, years = match.groups()
+        if years is None:
+            hidden_inputs[name.decode(ENCODING)] = value.decode(ENCODING)
+        elif year is None:
+            selected_year = __SELECTED_YEAR_REGEX.search(years)
+            if selected_year:
+                year = int(selected_year[1])
+    return Form(hidden_inputs, year)
+
+
+def get_form(website: httpx.Response) -> Form:
+    """
+    same as `scan_form` on the content of the response, the result is cached for each response
+    :param website: the response of the page
+    :return: Form of the page
+    """
+    form = __forms.get(website)
+    if form is None:
+        form = scan_form(website.content)
+        __forms[website] = form
+    return form
@@ -0,0 +1,148 @@
+import datetime
+import hashlib
+import json
+import time
+from collections import Counter
+from typing import Iterator, List, Optional, Tuple
+
+from telegram.ext import ExtBot
+
+import database
+import metrics
+from internet import Internet
+from parsers import Grade
+from send_queue import Priority
+from session_pool import pool
+
+# the months of the exams (and of the grades that follow them)
+EXAM_SEASON_MONTHS = (1, 2, 3, 6, 7, 8, 9)
+EXAM_SEASON_INTERVAL = 60 * 60
+DEFAULT_INTERVAL = 12 * 60 * 60
+# the grades of a user are not checked after these errors, until the user logs in again
+CREDENTIAL_ERRORS = (Internet.Error.WRONG_PASSWORD, Internet.Error.CHANGE_PASSWORD)
+
+
+def poll_interval(now: datetime.datetime) -> int:
+    """
+    :param now:
+    :return: the seconds between two checks of the grades of a user
+    """
+    return EXAM_SEASON_INTERVAL if now.month in EXAM_SEASON_MONTHS else DEFAULT_INTERVAL
+
+
+def snapshot_grades(grades: List[Grade]) -> Tuple[str, str]:
+    """
+    the compact form of the grades that is saved in the database
+    :param grades:
+    :return: (hash of the grades, the grades as json)
+    """
+    rows = json.dumps([list(grade) for grade in grades], ensure_ascii=False)
+    return hashlib.sha1(rows.encode('utf-8')).hexdigest(), rows
+
+
+def new_grades(old_grades: str, grades: List[Grade]) -> List[Grade]:
+    """
+    :param old_grades: the grades of the snapshot (as json)
+    :param grades: the current grades
+    :return: the published grades that are not in the snapshot (new grades and changed grades)
+    """
+    # the grade distribution is the row of the grade in orbit, it is not part of the grade
+    old = Counter(tuple(row[:3]) for row in json.loads(old_grades))
+    new = []
+    for grade in grades:
+        row = (grade.name, grade.units, grade.grade)
+        if old[row]:
+            old[row] -= 1
+        elif grade.grade != '':
+            new.append(grade)
+    return new
+
+
+def update_snapshot(user_id: int, grades: List[Grade]) -> List[Grade]:
+    """
+    save the grades as the snapshot of the user
+    :param user_id:
+    :param grades:
+    :return: the grades that were published since the last snapshot (empty on the first snapshot)
+    """
+    snapshot = database.get_grade_snapshot(user_id)
+    grades_hash, rows = snapshot_grades(grades)
+    database.save_grade_snapshot(user_id, grades_hash, rows, int(time.time()))
+    if not snapshot or not snapshot.grades or snapshot.grades_hash == grades_hash:
+        return []
+    # the rows of the grades may have moved, and the statistics of the changed grades are new
+    database.delete_grade_distributions(user_id)
+    return new_grades(snapshot.grades, grades)
+
+
+def get_fresh_grades(user_id: int) -> Optional[List[Grade]]:
+    """
+    :param user_id:
+    :return: the grades of the snapshot of the user, None if the snapshot is due to be checked again
+    """
+    snapshot = database.get_grade_snapshot(user_id)
+    now = datetime.datetime.now()
+    if not snapshot or not snapshot.grades or now.timestamp() - snapshot.checked_at >= poll_interval(now):
+        return None
+    return [Grade(*row) for row in json.loads(snapshot.grades)]
+
+
+def new_grades_text(grades: List[Grade]) -> str:
+    """
+    :param grades: the published grades (see `update_snapshot`)
+    :return: the message about the grades
+    """
+    grades_text = '\n'.join(f'{grade.name} - {grade.units} - {grade.grade}' for grade in grades)
+    return f'new grades:\n{grades_text}'
+
+
+def due_users(shard: Optional[database.Shard] = None) -> Iterator[database.User]:
+    """
+    :param shard: only the users of that shard (None for all the users)
+    :return: iterator of the users whose grades are due to be checked (see `is_due`)
+    """
+    now = datetime.datetime.now()
+    return database.iter_due_grade_users(int(now.timestamp()) - poll_interval(now), shard=shard)
+
+
+def is_due(user_id: int, now: datetime.datetime) -> bool:
+    """
+    only the users that used /get_grades or /get_grade_distribution (and have a snapshot) are checked,
+    and not after their login failed (the snapshot is deleted when the user logs in again or changes the year)
+    :param user_id:
+    :param now:
+    :return: is it time to check the grades of the user again
+    """
+    snapshot = database.get_grade_snapshot(user_id)
+    return bool(snapshot and not snapshot.login_failed and now.timestamp() - snapshot.checked_at >= poll_interval(now))
+
+
+async def poll_user(bot: ExtBot, user: database.User) -> bool:
+    """
+    check the grades of the user (if it is time to) and send the new grades to the user
+    :param bot:
+    :param user:
+    :return: is the grades checked successfully (or not needed to be checked)
+    """
+    # the grades may have been checked (by /get_grades) since the user was found due
+    if not is_due(user.user_id, datetime.datetime.now()):
+        return True
+
+    async with pool.session(user) as user_internet:
+        grades = await user_internet.get_grades()
+    metrics.count_error('get_grades', grades.error)
+    if grades.error:
+        # keep the old grades, and do not try again until the next check
+        # (or at all if the password is wrong, so orbit does not lock the account)
+        snapshot = database.get_grade_snapshot(user.user_id)
+        database.save_grade_snapshot(user.user_id,
+                                     snapshot and snapshot.grades_hash,
+                                     snapshot and snapshot.grades,
+                                     int(time.time()),
+                                     grades.error in CREDENTIAL_ERRORS)
+        return False
+
+    published = update_snapshot(user.user_id, grades.result)
+    if published:
+        await bot.send_message(chat_id=user.user_id, text=new_grades_text(published), rate_limit_args=Priority.DIGEST)
+    return True
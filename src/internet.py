@@ -1,21 +1,30 @@
 import functools
+import hashlib
 from enum import Enum
 from urllib.parse import urlencode, quote
 from collections import namedtuple
 from datetime import datetime
-from typing import Union, List, Optional
-import requests
-import html
+from typing import AsyncIterator, List, Union, Optional
+import asyncio
+import os
+import time
+import httpx
 import json
-import re
+import connection_pool
 import database
-from time_table_to_pdf import HebrewTimeTablePDF
+import metrics
+import recorder
+import tracing
+from form_scanner import get_form
+from parsers import Grade, Exam, Event, parse_years, parse_moodle_redirect, parse_sesskey, parse_events, \
+    parse_last_year_button, parse_lessons, parse_lesson_button, parse_grade_page_links, parse_grade_pages_count, \
+    parse_grades, parse_exams, parse_grade_distribution, parse_time_table
+import render_cache
 
-Grade = namedtuple('Grade', 'name units grade grade_distribution')
-Exam = namedtuple('Exam', 'name period time_start time_end mark room notebook_url register cancel_register number')
-Event = namedtuple('event', 'course_short_name name course_name course_id end_time url')
 Res = namedtuple('Result', 'result warnings error')
 GradesDistribution = namedtuple('GradesDistribution', 'grade average standard_deviation position image')
+# a call of a moodle web service function (like `core_calendar_get_action_events_by_timesort`) and its arguments
+MoodleCall = namedtuple('MoodleCall', 'method args')
 
 
 class Document(Enum):
@@ -48,6 +57,18 @@ documents_file_name = {
 }
 
 
+def grade_distribution_key(grade: Grade) -> Optional[str]:
+    """
+    the key of the grade distribution of a subject (for `Internet.get_grade_distribution`):
+    the row of the subject in orbit and a short hash of its name, the rows move when a new grade is published
+    :param grade:
+    :return: the key, None if the subject has no grade distribution
+    """
+    if not grade.grade_distribution:
+        return None
+    return f'{grade.grade_distribution}_{hashlib.sha1(grade.name.encode("utf-8")).hexdigest()[:8]}'
+
+
 def required_decorator(required_function):
     """
     decorator for needed function to works
@@ -63,11 +84,13 @@ def required_decorator(required_function):
         """
 
         @functools.wraps(function)
-        def actual_function(self, *args, **kwargs):
-            res, warnings, error = required_function(self)
+        async def actual_function(self, *args, **kwargs):
+            with tracing.span(required_function.__name__):
+                res, warnings, error = await required_function(self)
             if error:
                 return Res(False, warnings[:], error)
-            return function(self, res, warnings[:], *args, **kwargs)
+            with tracing.span(function.__name__):
+                return await function(self, res, warnings[:], *args, **kwargs)
 
         return actual_function
 
@@ -77,8 +100,12 @@ def required_decorator(required_function):
 class Internet:
     """
     This class communicate with orbit and moodle.
+    all the requests are async (the session is an `httpx.AsyncClient`) so many users can be served on the same loop.
+    every object has its own cookies, the connections are shared by all the objects (see `connection_pool`).
     """
-    __ORBIT_URL = 'https://live.or-bit.net/hadassah'
+    # the hosts can be changed (for example to a local fake server for load testing)
+    __ORBIT_HOST = os.environ.get('ORBIT_HOST', 'https://live.or-bit.net')
+    __ORBIT_URL = f'{__ORBIT_HOST}/hadassah'
     __MAIN_URL = f'{__ORBIT_URL}/Main.aspx'
     __LOGIN_URL = f'{__ORBIT_URL}/Login.aspx'
     __CHANGE_PASSWORD_URL = f'{__ORBIT_URL}/ChangePassword.aspx'
@@ -89,15 +116,94 @@ class Internet:
     __SET_SCHEDULE_URL = f'{__ORBIT_URL}/CreateStudentWeeklySchedule.aspx'
     __TIME_TABLE_URL = f'{__ORBIT_URL}/StudentPeriodSchedule.aspx'
 
-    __MOODLE_URL = 'https://mowgli.hac.ac.il'
+    __MOODLE_URL = os.environ.get('MOODLE_URL', 'https://mowgli.hac.ac.il')
     __MY_MOODLE = f'{__MOODLE_URL}/my/'
+    __MOODLE_LOGIN_URL = f'{__MOODLE_URL}/login/'
+    __MOODLE_PROFILE_URL = f'{__MOODLE_URL}/user/profile.php'
     __MOODLE_SERVICE_URL = f'{__MOODLE_URL}/lib/ajax/service.php'
 
+    __TIMEOUT = 30
+    # session cookies of orbit and moodle have no expiry, they are kept in the database for that long after last use
+    __SESSION_COOKIE_TTL = 20 * 60
+    # the statistics of a grade rarely change after the grades are published
+    __GRADE_DISTRIBUTION_TTL = 24 * 60 * 60
+    # the most events moodle returns in one call of `core_calendar_get_action_events_by_timesort`
+    EVENTS_PAGE_SIZE = 50
+
+    # post back all the pages of the grades list from the first page at the same time,
+    # instead of walking the pager one page after the other
+    CONCURRENT_GRADE_PAGES = True
+
     def __init__(self, user: database.User):
-        self.session = requests.session()
+        self.session = httpx.AsyncClient(follow_redirects=True, timeout=Internet.__TIMEOUT,
+                                         transport=connection_pool.transport)
         self.moodle_res = Res(False, [], None)
         self.orbit_res = Res(False, [], None)
         self.user = user
+        self.__cookies_loaded = None
+        # the session key of the moodle session, taken from a moodle page only when it is needed
+        self.__sesskey = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    @staticmethod
+    async def warm_up(connections: int = connection_pool.HTTP_WARM_UP_CONNECTIONS):
+        """
+        open connections to orbit and moodle in the shared pool
+        :param connections: the number of connections to every one of them
+        """
+        await connection_pool.transport.warm_up([Internet.__LOGIN_URL, Internet.__MOODLE_LOGIN_URL], connections)
+
+    async def close(self, save: bool = True):
+        """
+        close the http session of this object (and save its cookies for next time)
+        :param save: save the cookies (False when the login info of the user changed and the session is useless)
+        """
+        if save and self.orbit_res.result:
+            self.__save_cookies()
+        await self.session.aclose()
+
+    def __load_cookies(self) -> bool:
+        """
+        load the saved cookies of the user into the session (only the first time it called)
+        :return: is there any saved cookies
+        """
+        if self.__cookies_loaded is None:
+            cookies = database.get_cookies(self.user.user_id, self.user.user_name, self.user.year)
+            for cookie in cookies:
+                self.session.cookies.set(cookie.name, cookie.value, domain=cookie.domain, path=cookie.path)
+            self.__cookies_loaded = bool(cookies)
+        return self.__cookies_loaded
+
+    def __save_cookies(self):
+        """
+        save the cookies of the session in the database
+        """
+        expires = int(datetime.now().timestamp()) + Internet.__SESSION_COOKIE_TTL
+        database.save_cookies(self.user.user_id, self.user.user_name, self.user.year,
+                              [database.Cookie(domain=cookie.domain,
+                                               name=cookie.name,
+                                               value=cookie.value,
+                                               path=cookie.path,
+                                               expires=cookie.expires or expires)
+                               for cookie in self.session.cookies.jar])
+
+    async def __is_logged_in(self, url: str, login_url: str) -> bool:
+        """
+        check with one cheap request if the session is logged in
+        :param url: page that only logged-in user can see
+        :param login_url: the page a user that is not logged in redirected to
+        :return: is the session logged in
+        """
+        try:
+            website = await self.__send('GET', url)
+        except httpx.HTTPError:
+            return False
+        return website.status_code == 200 and not str(website.url).startswith(login_url)
 
     class Error(Enum):
         ORBIT_DOWN = 0
@@ -107,11 +213,12 @@ class Internet:
         WEBSITE_DOWN = 4
         CHANGE_PASSWORD = 5
         OLD_EQUAL_NEW_PASSWORD = 6
+        GRADES_CHANGED = 7
 
     class Warning(Enum):
         CHANGE_PASSWORD = 0
 
-    def connect_orbit(self) -> Res:
+    async def connect_orbit(self) -> Res:
         """
         connect to robit website using the username and password
         if this object already connected the method do nothing (and return the res of the first time tried to connect)
@@ -120,13 +227,17 @@ class Internet:
         if self.orbit_res.result:
             return self.orbit_res
 
-        orbit_login_website = self.__get(Internet.__LOGIN_URL)
+        if self.__load_cookies() and await self.__is_logged_in(Internet.__MAIN_URL, Internet.__LOGIN_URL):
+            self.orbit_res = Res(True, self.orbit_res.warnings, None)
+            return self.orbit_res
+
+        orbit_login_website = await self.__get(Internet.__LOGIN_URL)
 
         if orbit_login_website.status_code != 200:
             self.orbit_res = Res(False, [], Internet.Error.ORBIT_DOWN)
             return self.orbit_res
 
-        login_data = self.__get_hidden_inputs(orbit_login_website.text)
+        login_data = self.__get_hidden_inputs(orbit_login_website)
         login_data.update(
             {
                 'edtUsername': self.user.user_name,
@@ -137,27 +248,28 @@ class Internet:
                 'btnLogin': 'כניסה'
             }
         )
-        orbit_website = self.__post(Internet.__LOGIN_URL, payload_data=login_data)
+        orbit_website = await self.__post(Internet.__LOGIN_URL, payload_data=login_data)
 
         if orbit_website.status_code != 200 or orbit_website.url == Internet.__LOGIN_URL:
             self.orbit_res = Res(False, [], Internet.Error.WRONG_PASSWORD)
             return self.orbit_res
 
         if orbit_website.url == Internet.__CHANGE_PASSWORD_URL:
-            if self.__get(Internet.__MAIN_URL).url == Internet.__CHANGE_PASSWORD_URL:
+            if (await self.__get(Internet.__MAIN_URL)).url == Internet.__CHANGE_PASSWORD_URL:
                 self.orbit_res = Res(False, [], Internet.Error.CHANGE_PASSWORD)
                 return self.orbit_res
             self.orbit_res.warnings.append(Internet.Warning.CHANGE_PASSWORD)
 
         if self.user.year:
-            inputs = self.__get_hidden_inputs(orbit_website.text)
-            self.__post(Internet.__MAIN_URL, payload_data=inputs)
+            inputs = self.__get_hidden_inputs(orbit_website)
+            await self.__post(Internet.__MAIN_URL, payload_data=inputs)
 
         self.orbit_res = Res(True, self.orbit_res.warnings, None)
+        self.__save_cookies()
         return self.orbit_res
 
     @required_decorator(connect_orbit)
-    def connect_moodle(self, _, warnings) -> Res:
+    async def connect_moodle(self, _, warnings) -> Res:
         """
         connect to moodle website
         :return: is the method successfully connect to moodle
@@ -165,108 +277,158 @@ class Internet:
         if self.moodle_res.result:
             return self.moodle_res
 
-        moodle_session = self.__get(Internet.__CONNECT_MOODLE_URL)
+        if self.__load_cookies() and await self.__is_logged_in(Internet.__MOODLE_PROFILE_URL,
+                                                               Internet.__MOODLE_LOGIN_URL):
+            self.moodle_res = Res(True, warnings, None)
+            return self.moodle_res
+
+        moodle_session = await self.__get(Internet.__CONNECT_MOODLE_URL)
         if moodle_session.status_code != 200:
             self.moodle_res = Res(False, warnings, Internet.Error.MOODLE_DOWN)
             return self.moodle_res
 
-        reg = re.search("URL='(.*?)'", moodle_session.text)
-        if not reg:
+        redirect_url = parse_moodle_redirect(moodle_session.text)
+        if not redirect_url:
             self.moodle_res = Res(False, warnings, Internet.Error.BOT_ERROR)
+            return self.moodle_res
 
-        redirect_url = reg[1]
-        moodle_website = self.__get(redirect_url)
+        moodle_website = await self.__get(redirect_url)
         if moodle_website.status_code != 200 or moodle_website.url != Internet.__MY_MOODLE:
             self.moodle_res = Res(False, warnings, Internet.Error.MOODLE_DOWN)
             return self.moodle_res
+        # the login ends on the dashboard, it has the session key of the new session
+        self.__sesskey = parse_sesskey(moodle_website.text)
         self.moodle_res = Res(True, warnings, None)
+        self.__save_cookies()
         return self.moodle_res
 
     @required_decorator(connect_orbit)
-    def get_years(self, _, warnings) -> Res:
+    async def get_years(self, _, warnings) -> Res:
         """
         get all the years from that can be picked
         """
-        website = self.__get(Internet.__MAIN_URL)
-        years_regex = '<select name="ctl00\\$cmbActiveYear".*?</select'
-        year_regex = 'value="([0-9]*?)"'
-        years = re.findall(years_regex, website.text, re.DOTALL)[0]
-        years = re.findall(year_regex, years, re.DOTALL)
-        return Res(years, warnings, None)
+        website = await self.__get(Internet.__MAIN_URL)
+        return Res(parse_years(website.text), warnings, None)
 
     @required_decorator(connect_moodle)
-    def get_unfinished_events(self, _, warnings, last_date: datetime = None) -> Res:
+    async def get_unfinished_events(self, _, warnings, last_date: datetime = None) -> Res:
         """
         get undefined events from the moodle website
         :param last_date: events that past that date filtered out of the of
         :return: the last undefined events or None if something go wrong
         """
-        moodle_website = self.__get(Internet.__MY_MOODLE)
-
-        if moodle_website.status_code != 200:
-            return Res(None, warnings, Internet.Error.MOODLE_DOWN)
+        events = []
+        async for page in self.iter_unfinished_events(last_date):
+            if page.error:
+                return Res(None, warnings, page.error)
+            events += page.result
+        return Res(events, warnings, None)
+
+    async def iter_unfinished_events(self, last_date: datetime = None,
+                                     page_size: int = EVENTS_PAGE_SIZE) -> AsyncIterator[Res]:
+        """
+        get the undefined events from the moodle website page after page (ordered by their end time),
+        moodle filters the events by the date, and the next page starts after the last event of the previous one
+        :param last_date: events that past that date are not returned
+        :param page_size: the number of events in a page (at most `EVENTS_PAGE_SIZE`)
+        :return: async iterator of the Res of every page (list of Events), it stops after a Res with an error
+        """
+        args = {"limitnum": page_size,
+                "timesortfrom": int(datetime.now().timestamp()),
+                "limittononsuspendedevents": True}
+        if last_date:
+            args["timesortto"] = int(last_date.timestamp())
+        while True:
+            page = await self.call_moodle([MoodleCall('core_calendar_get_action_events_by_timesort', args)])
+            if page.error:
+                yield page
+                return
+            data = page.result[0]
+            yield Res(parse_events(data['events']), page.warnings, None)
+            if len(data['events']) < page_size or data['lasteventid'] == args.get('aftereventid'):
+                return
+            args = dict(args, aftereventid=data['lasteventid'])
 
-        reg = re.search('"sesskey":"(.*?)"', moodle_website.text)
-        if not reg:
+    @required_decorator(connect_moodle)
+    async def call_moodle(self, _, warnings, calls: List[MoodleCall]) -> Res:
+        """
+        call moodle web service functions, all the calls are sent in one request to the ajax service.
+        if moodle says the session key is not valid, the session key is taken again and the calls are sent again
+        :param calls: the functions to call
+        :return: list of the data that every function returned (by the order of the calls)
+        """
+        payload = [{'index': index, 'methodname': call.method, 'args': call.args} for index, call in enumerate(calls)]
+        for _ in range(2):
+            sesskey = await self.__get_sesskey()
+            if sesskey.error:
+                return Res(None, warnings, sesskey.error)
+            response = await self.__post(Internet.__MOODLE_SERVICE_URL,
+                                         payload_json=payload,
+                                         get_payload={'sesskey': sesskey.result,
+                                                      'info': ','.join(call.method for call in calls)})
+            if response.status_code != 200:
+                return Res(None, warnings, Internet.Error.BOT_ERROR)
+            responses = json.loads(response.text)
+            if not Internet.__is_invalid_sesskey(responses):
+                break
+            self.__sesskey = None
+        else:
             return Res(None, warnings, Internet.Error.BOT_ERROR)
 
-        moodle_session_key = reg[1]
-
-        get_payload = {'sesskey': moodle_session_key,
-                       'info': 'core_calendar_get_action_events_by_timesort'}
-        post_payload = [{"index": 0,
-                         "methodname": "core_calendar_get_action_events_by_timesort",
-                         "args": {
-                             "limitnum": 50,
-                             "timesortfrom": int(datetime.now().timestamp()),
-                             "limittononsuspendedevents": True
-                         }
-                         }]
-        unfinished_events = self.__post(Internet.__MOODLE_SERVICE_URL,
-                                        payload_json=post_payload,
-                                        get_payload=get_payload)
-        if unfinished_events.status_code != 200:
-            return Res(None, warnings, Internet.Error.BOT_ERROR)
-        data = json.loads(unfinished_events.text)
-        if data[0]['error']:
+        # moodle stops at the first function that failed
+        if not isinstance(responses, list) or len(responses) != len(calls) \
+                or any(call_response['error'] for call_response in responses):
             return Res(None, warnings, Internet.Error.BOT_ERROR)
-        data = [Event(course_short_name=get_short_name(event['course']['shortname']),
-                      name=event['name'],
-                      course_name=event['course']['shortname'],
-                      course_id=event['course']['id'],
-                      end_time=datetime.fromtimestamp(event['timesort']),
-                      url=event['url'])
-                for event in data[0]['data']['events']
-                ]
-        if last_date:
-            data = list(filter(lambda event: event.end_time <= last_date, data))
-        return Res(data, warnings, None)
+        return Res([call_response['data'] for call_response in responses], warnings, None)
+
+    async def __get_sesskey(self) -> Res:
+        """
+        get the session key of the moodle session (from the dashboard, only if it is not known yet)
+        :return: the session key
+        """
+        if not self.__sesskey:
+            moodle_website = await self.__get(Internet.__MY_MOODLE)
+            if moodle_website.status_code != 200:
+                return Res(None, [], Internet.Error.MOODLE_DOWN)
+            self.__sesskey = parse_sesskey(moodle_website.text)
+            if not self.__sesskey:
+                return Res(None, [], Internet.Error.BOT_ERROR)
+        return Res(self.__sesskey, [], None)
+
+    @staticmethod
+    def __is_invalid_sesskey(responses: Union[dict, list]) -> bool:
+        """
+        :param responses: the json of the ajax service (an error of the whole request is a dict)
+        :return: is the request failed because its session key is not valid
+        """
+        errors = [responses] if isinstance(responses, dict) else \
+            [call_response.get('exception') or {} for call_response in responses if call_response.get('error')]
+        return any(error.get('errorcode') == 'invalidsesskey' for error in errors)
 
     @required_decorator(connect_orbit)
-    def get_lessons(self, _, warnings, text: Optional[str] = None) -> Res:
+    async def __get_lessons_website(self, _, warnings) -> Res:
+        """
+        get the set schedule page of the last year from the orbit
+        :return: Respond of the website
+        """
+        website = await self.__get(Internet.__SET_SCHEDULE_URL)
+        inputs = self.__get_hidden_inputs(website)
+        last_year = parse_last_year_button(website.text)
+        inputs[f'{last_year}.x'] = 0
+        inputs[f'{last_year}.y'] = 0
+        website = await self.__post(Internet.__SET_SCHEDULE_URL, payload_data=inputs)
+        return Res(website, warnings, None)
+
+    @required_decorator(__get_lessons_website)
+    async def get_lessons(self, website, warnings) -> Res:
         """
         get lesson that can be registered
-        :param text: the website output as text if None, the function open the page
         :return: List of lessons
         """
-        if not text:
-            website = self.__get(Internet.__SET_SCHEDULE_URL)
-            inputs = self.__get_hidden_inputs(website.text)
-            last_year = re.findall(r'ctl00\$ContentPlaceHolder1\$gvBalance\$GridRow[0-9]+?\$btnBalanceDataDetails',
-                                   website.text,
-                                   re.DOTALL)[-1]
-            inputs[f'{last_year}.x'] = 0
-            inputs[f'{last_year}.y'] = 0
-            website = self.__post(Internet.__SET_SCHEDULE_URL, payload_data=inputs)
-            text = website.text
-        lessons = re.findall(r'(ctl00\$ContentPlaceHolder1\$gvLinkToLessons\$GridRow[0-9]+?\$btnLinkStudentToLesson).*?'
-                             r'<table>\s*?<tr>\s*?<td>(.*?)</td>\s*?</tr>\s*?</table>\s*?</span>\s*?</td>\s*?<td valign'
-                             r'="top" nowrap="nowrap">\s*?<span id=".*?">(.*?)</span>', text, re.DOTALL)
-
-        return Res(lessons, warnings, None)
+        return Res(parse_lessons(website.text), warnings, None)
 
     @required_decorator(get_lessons)
-    def get_classes(self, lessons, warnings) -> Res:
+    async def get_classes(self, lessons, warnings) -> Res:
         """
         get all class available via orbit
         :return: all class available via orbit (as set)
@@ -274,175 +436,172 @@ class Internet:
         classes = {lesson[2].split('-')[-1] for lesson in lessons}
         return Res(classes, warnings, None)
 
-    @required_decorator(get_lessons)
-    def register_for_class(self, lessons, warnings, class_name: str):
-        website = self.__get(Internet.__SET_SCHEDULE_URL)
-        last_year = re.findall(r'ctl00\$ContentPlaceHolder1\$gvBalance\$GridRow[0-9]+?\$btnBalanceDataDetails',
-                               website.text,
-                               re.DOTALL)[-1]
-        inputs = self.__get_hidden_inputs(website.text)
-        inputs[f'{last_year}.x'] = 0
-        inputs[f'{last_year}.y'] = 0
-        website = self.__post(Internet.__SET_SCHEDULE_URL, payload_data=inputs)
-
+    @required_decorator(__get_lessons_website)
+    async def register_for_class(self, website, warnings, class_name: str):
+        """
+        register to all the lessons of a class (one postback for every lesson)
+        :param class_name: the class (the last part of the lesson code)
+        :return: (the registered lessons, the lessons the registration to them failed)
+        """
         registered_lessons = []
         unregistered_lessons = []
-        websites = []
-        do_stuff = True
-        while do_stuff:
-            do_stuff = False
-            for lesson in lessons:
-                if any(lesson[2] == less[2] for less in (registered_lessons + unregistered_lessons)):
-                    continue
-                if lesson[2].split('-')[-1] != class_name:
-                    continue
-                inputs = self.__get_hidden_inputs(website.text)
-                inputs[f'{lesson[0]}.x'] = 1
-                inputs[f'{lesson[0]}.y'] = 1
-                website = self.__post(Internet.__SET_SCHEDULE_URL, payload_data=inputs)
-                websites.append(website)
-                if 'function OLScriptCounter1alert() {' in website.text:
-                    unregistered_lessons.append(lesson)
-                else:
-                    registered_lessons.append(lesson)
-                do_stuff = True
-                lessons = self.get_lessons(website.text)[0]
-                break
+        handled = set()
+        for lesson in parse_lessons(website.text):
+            if lesson[2] in handled or lesson[2].split('-')[-1] != class_name:
+                continue
+            handled.add(lesson[2])
+            # the rows of the lessons move after every registration, only the button of this lesson is looked for
+            button = parse_lesson_button(website.text, lesson[2])
+            if not button:
+                continue
+            inputs = self.__get_hidden_inputs(website)
+            inputs[f'{button}.x'] = 1
+            inputs[f'{button}.y'] = 1
+            website = await self.__post(Internet.__SET_SCHEDULE_URL, payload_data=inputs)
+            if 'function OLScriptCounter1alert() {' in website.text:
+                unregistered_lessons.append(lesson)
+            else:
+                registered_lessons.append(lesson)
         return Res((registered_lessons, unregistered_lessons), warnings, None)
 
     @required_decorator(connect_orbit)
-    def get_document(self, _, warnings, document: Document) -> Res:
+    async def get_document(self, _, warnings, document: Document) -> Res:
         """
         get specific document from the moodle website
         :param document: the document needed from the orbit website
         :return: a raw data of the document (bytes)
         """
 
-        website = self.__get(Internet.__GET_DOCUMENT_URL)
+        website = await self.__get(Internet.__GET_DOCUMENT_URL)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
-        hidden_inputs = self.__get_hidden_inputs(website.text)
+        hidden_inputs = self.__get_hidden_inputs(website)
         hidden_inputs['ctl00$ContentPlaceHolder1$cmbDivision'] = 1
         hidden_inputs[f'ctl00$ContentPlaceHolder1$gvDocuments$GridRow{document.value}$ibDownloadDocument.x'] = 1
         hidden_inputs[f'ctl00$ContentPlaceHolder1$gvDocuments$GridRow{document.value}$ibDownloadDocument.y'] = 1
 
-        return Res(self.__post(Internet.__GET_DOCUMENT_URL,
-                               payload_data=hidden_inputs).content, warnings, None)
+        return Res((await self.__post(Internet.__GET_DOCUMENT_URL,
+                                      payload_data=hidden_inputs)).content, warnings, None)
 
     @required_decorator(connect_orbit)
-    def get_grades(self, _, warnings) -> Res:
+    async def get_grades(self, _, warnings) -> Res:
         """
         get all orbits grades and connect the orbit with username and password if not connected yet
         :return: list of Grades: the grades of the user
         """
 
-        website = self.__get(Internet.__GRADE_LIST_URL)
+        website = await self.__get(Internet.__GRADE_LIST_URL)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
 
-        pages_regex = 'javascript:__doPostBack\\(&#39;ctl00\\' \
-                      '$ContentPlaceHolder1\\$gvGradesList&#39;,&#39;Page\\$([1-9])&#39;\\)'
-        last_page = len(re.findall(pages_regex, website.text)) + 1
-        page = 1
-        grades = []
-        while page <= last_page:
-            grades += Internet.__get_grade_from_page(website.text, page)
-            page += 1
-            if page <= last_page:
-                inputs = self.__get_hidden_inputs(website.text)
-                inputs['__EVENTTARGET'] = 'ctl00$ContentPlaceHolder1$gvGradesList'
-                inputs['__EVENTARGUMENT'] = f'Page${page}'
-                website = self.__post(Internet.__GRADE_LIST_URL, payload_data=inputs)
+        last_page = parse_grade_pages_count(website.text)
+        pages = None
+        if Internet.CONCURRENT_GRADE_PAGES and last_page > 1:
+            pages = await self.__get_grade_pages_concurrently(website, last_page)
+        if pages is None:
+            pages = await self.__get_grade_pages_serially(website, last_page)
 
+        grades = []
+        for page, text in enumerate(pages, 1):
+            grades += parse_grades(text, page)
         return Res(grades, warnings, None)
 
+    def __grade_page_inputs(self, website: httpx.Response, page: int) -> dict:
+        """
+        :param website: a page of the grades list
+        :param page: the number of the page to move to
+        :return: the inputs of the postback that moves from `website` to the page
+        """
+        inputs = self.__get_hidden_inputs(website)
+        inputs['__EVENTTARGET'] = 'ctl00$ContentPlaceHolder1$gvGradesList'
+        inputs['__EVENTARGUMENT'] = f'Page${page}'
+        return inputs
+
+    async def __get_grade_pages_serially(self, first_page: httpx.Response, last_page: int) -> List[str]:
+        """
+        walk the pager of the grades list, every page is posted back from the previous one
+        :param first_page: the first page of the grades list
+        :param last_page: the number of pages
+        :return: the text of all the pages by order
+        """
+        website = first_page
+        pages = [website.text]
+        for page in range(2, last_page + 1):
+            website = await self.__post(Internet.__GRADE_LIST_URL,
+                                        payload_data=self.__grade_page_inputs(website, page))
+            pages.append(website.text)
+        return pages
+
+    async def __get_grade_pages_concurrently(self, first_page: httpx.Response, last_page: int) -> Optional[List[str]]:
+        """
+        post back all the pages of the grades list from the first page at the same time
+        :param first_page: the first page of the grades list
+        :param last_page: the number of pages
+        :return: the text of all the pages by order, None if orbit did not return one of the pages
+        """
+        responses = await asyncio.gather(*[self.__post(Internet.__GRADE_LIST_URL,
+                                                       payload_data=self.__grade_page_inputs(first_page, page))
+                                           for page in range(2, last_page + 1)])
+        pages = [first_page.text]
+        for page, response in enumerate(responses, 2):
+            # the pager of a page links to every page but itself
+            links = parse_grade_page_links(response.text)
+            if response.status_code != 200 or page in links or 1 not in links:
+                return None
+            pages.append(response.text)
+        return pages
+
     @required_decorator(connect_orbit)
-    def __get_exam_website(self, _, warnings) -> Res:
+    async def __get_exam_website(self, _, warnings) -> Res:
         """
         get the website of the exams from the orbit
         :return: Respond of the website
         """
-        website = self.__get(Internet.__EXAMS_URL)
+        website = await self.__get(Internet.__EXAMS_URL)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
         return Res(website, warnings, None)
 
     @required_decorator(__get_exam_website)
-    def get_all_exams(self, website, warnings) -> Res:
+    async def get_all_exams(self, website, warnings) -> Res:
         """
         get list of the user's exams
         :return: list of the user's exams
         """
-        inputs = self.__get_hidden_inputs(website.text)
+        inputs = self.__get_hidden_inputs(website)
         inputs['ctl00$tbMain$ctl03$ddlExamDateRangeFilter'] = 1
-        website = self.__post(Internet.__EXAMS_URL, payload_data=inputs)
-        all_exams_text = re.findall(
-            '<tr id="ContentPlaceHolder1_gvStudentAssignmentTermList" class="GridRow">(?:.*?)*</tr>',
-            website.text,
-            re.DOTALL)
-        all_exams_text = [re.findall('<td.*?>(.*?)</td>', exam, re.DOTALL) for exam in all_exams_text]
-
-        all_exams = []
-        for index, exam in enumerate(all_exams_text):
-            name = exam[10]
-            time = re.search('>([^>]*?)</span', exam[2]).group(1).split('-')
-            if len(time) < 2:
-                time = ['00:00', '00:00']
-            if exam[0] == '&nbsp;':
-                exam[0] = '01/01/0001'
-            time_start = datetime.strptime(f"{exam[0]} {time[0]}", '%d/%m/%Y %H:%M')
-            time_end = datetime.strptime(f"{exam[0]} {time[1]}", '%d/%m/%Y %H:%M')
-            period = exam[4]
-            mark = None if exam[5] == '&nbsp;' else exam[5]
-            room = '' if exam[7] == '&nbsp;' else exam[7]
-            notebook = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}$btnDownload"' in exam[13]
-            register = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}$' \
-                       f'btnRequestExamAssign"' in exam[12]
-            cancel_register = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}' \
-                              f'$btnRequestExamAssignCancel"' in exam[12]
-
-            all_exams.append(Exam(name=name,
-                                  period=period,
-                                  time_start=time_start,
-                                  time_end=time_end,
-                                  mark=mark,
-                                  room=room,
-                                  notebook_url=notebook,
-                                  register=register,
-                                  cancel_register=cancel_register,
-                                  number=index))
-
-        return Res(all_exams, warnings, None)
+        website = await self.__post(Internet.__EXAMS_URL, payload_data=inputs)
+        return Res(parse_exams(website.text), warnings, None)
 
     @required_decorator(__get_exam_website)
-    def get_exam_notebook(self, website, warnings, number):
+    async def get_exam_notebook(self, website, warnings, number):
         """
         get notebook of specific exam
         :param number: the number of the notebook (Exam.notebook_url)
         :return: a row data of the file
         """
-        inputs = self.__get_hidden_inputs(website.text)
+        inputs = self.__get_hidden_inputs(website)
         inputs['ctl00$btnOkAgreement'] = 'אישור'
         inputs['ctl00$tbMain$ctl03$ddlExamDateRangeFilter'] = 1
-        website = self.__post(Internet.__EXAMS_URL, payload_data=inputs)
-        inputs = self.__get_hidden_inputs(website.text)
+        website = await self.__post(Internet.__EXAMS_URL, payload_data=inputs)
+        inputs = self.__get_hidden_inputs(website)
         inputs['ctl00$tbMain$ctl03$ddlExamDateRangeFilter'] = 1
         inputs[f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{number}$btnDownload.x'] = 1
         inputs[f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{number}$btnDownload.y'] = 1
-        return Res(self.__post(Internet.__EXAMS_URL,
-                               payload_data=inputs).content, warnings, None)
+        return Res((await self.__post(Internet.__EXAMS_URL,
+                                      payload_data=inputs)).content, warnings, None)
 
     @required_decorator(connect_orbit)
-    def register_exam(self, _, warnings, number, register):
-        website = self.__get('https://live.or-bit.net/hadassah/StudentAssignmentTermList.aspx')
+    async def register_exam(self, _, warnings, number, register):
+        website = await self.__get(Internet.__EXAMS_URL)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
 
-        inputs = self.__get_hidden_inputs(website.text)
+        inputs = self.__get_hidden_inputs(website)
         inputs['ctl00$btnOkAgreement'] = 'אישור'
         inputs['ctl00$tbMain$ctl03$ddlExamDateRangeFilter'] = 1
-        website = self.__post('https://live.or-bit.net/hadassah/StudentAssignmentTermList.aspx', payload_data=inputs)
-        inputs = self.__get_hidden_inputs(website.text)
+        website = await self.__post(Internet.__EXAMS_URL, payload_data=inputs)
+        inputs = self.__get_hidden_inputs(website)
 
         btn_data = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{number}$btnRequestExamAssign'
         if not register:
@@ -450,14 +609,14 @@ class Internet:
 
         inputs['ctl00$tbMain$ctl03$ddlExamDateRangeFilter'] = 1
         inputs[btn_data] = 1
-        website = self.__post('https://live.or-bit.net/hadassah/StudentAssignmentTermList.aspx', payload_data=inputs)
+        website = await self.__post(Internet.__EXAMS_URL, payload_data=inputs)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
 
         return Res(True, warnings, None)
 
     @required_decorator(connect_orbit)
-    def change_password(self, _, __, new_password: str):
+    async def change_password(self, _, __, new_password: str):
         """
         change password in the orbit website
         :param new_password: the new password the user want
@@ -465,37 +624,66 @@ class Internet:
         """
         if self.user.password == new_password:
             return Res(False, [], Internet.Error.OLD_EQUAL_NEW_PASSWORD)
-        website = self.__get(Internet.__CHANGE_PASSWORD_URL)
-        inputs = self.__get_hidden_inputs(website.text)
+        website = await self.__get(Internet.__CHANGE_PASSWORD_URL)
+        inputs = self.__get_hidden_inputs(website)
         inputs['ctl00$ContentPlaceHolder1$edtCurrentPassword'] = self.user.password
         inputs['ctl00$ContentPlaceHolder1$edtNewPassword1'] = new_password
         inputs['ctl00$ContentPlaceHolder1$edtNewPassword2'] = new_password
         inputs['ctl00$ContentPlaceHolder1$btnSave'] = 'עדכן'
-        website = self.__post(Internet.__CHANGE_PASSWORD_URL, payload_data=inputs)
+        website = await self.__post(Internet.__CHANGE_PASSWORD_URL, payload_data=inputs)
         if 'OLScriptCounter1alert() { window.alert(' in website.text:
             return Res(False, [], Internet.Error.OLD_EQUAL_NEW_PASSWORD)
         return Res(True, [], None)
 
+    async def get_grade_distribution(self, grade_distribution: str) -> Res:
+        """
+        get the grade distribution of specific subject,
+        distributions that were taken from orbit in the last `__GRADE_DISTRIBUTION_TTL` seconds are taken from the database
+        :param grade_distribution: the `grade_distribution_key` of the wanted subject
+        :return: GradesDistribution
+        """
+        # the key has the name of the subject, so a saved distribution is of the same subject even if the rows moved
+        cached = database.get_grade_distribution(self.user.user_id, self.user.year, grade_distribution,
+                                                 int(time.time()) - Internet.__GRADE_DISTRIBUTION_TTL)
+        if cached:
+            return Res(GradesDistribution(*cached), [], None)
+
+        res = await self.__get_grade_distribution_from_orbit(grade_distribution)
+        if res.result:
+            database.save_grade_distribution(self.user.user_id, self.user.year, grade_distribution,
+                                             database.CachedGradeDistribution(*res.result), int(time.time()))
+        return res
+
     @required_decorator(connect_orbit)
-    def get_grade_distribution(self, _, warnings, grade_distribution: str):
+    async def __get_grade_distribution_from_orbit(self, _, warnings, grade_distribution: str):
         """
-        get the grade distribution of specific subject
-        :param grade_distribution: the Grade.grade_distribution of the wanted subject
+        get the grade distribution of specific subject from orbit
+        :param grade_distribution: the `grade_distribution_key` of the wanted subject
+        (or the Grade.grade_distribution, then the subject in that row now is taken)
         :return: GradesDistribution
         """
-        website = self.__get(Internet.__GRADE_LIST_URL)
+        website = await self.__get(Internet.__GRADE_LIST_URL)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
         grade_distribution = grade_distribution.split('_')
 
-        inputs = self.__get_hidden_inputs(website.text)
+        inputs = self.__get_hidden_inputs(website)
         inputs['__EVENTTARGET'] = 'ctl00$ContentPlaceHolder1$gvGradesList'
         inputs['__EVENTARGUMENT'] = f'Page${grade_distribution[0]}'
-        website = self.__post(Internet.__GRADE_LIST_URL, payload_data=inputs)
+        website = await self.__post(Internet.__GRADE_LIST_URL, payload_data=inputs)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
 
-        inputs = self.__get_hidden_inputs(website.text)
+        if len(grade_distribution) > 2:
+            # the subject may have moved since the key was taken, look for it in the rows of the page now
+            keys = [grade_distribution_key(grade) for grade in parse_grades(website.text, int(grade_distribution[0]))]
+            rows = [key.split('_')[1] for key in keys if key and key.split('_')[2] == grade_distribution[2]]
+            if not rows:
+                return Res(False, warnings, Internet.Error.GRADES_CHANGED)
+            if grade_distribution[1] not in rows:
+                grade_distribution[1] = rows[0]
+
+        inputs = self.__get_hidden_inputs(website)
         inputs[f'ctl00'
                f'$ContentPlaceHolder1'
                f'$gvGradesList'
@@ -506,18 +694,13 @@ class Internet:
                f'$gvGradesList'
                f'$GridRow{grade_distribution[1]}'
                f'$imgShowGradeDistribution.y'] = 1
-        website = self.__post(Internet.__GRADE_LIST_URL, payload_data=inputs)
+        website = await self.__post(Internet.__GRADE_LIST_URL, payload_data=inputs)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
-        table = re.findall('<span id="ContentPlaceHolder1_ucLessonGradeDistribution_lblStatData"><table>(.*?)</table>',
-                           website.text, re.DOTALL)[0]
-        table = re.findall('<td.*?>(.*?)</td>', table, re.DOTALL)
-        grade = table[1]
-        avg = table[3]
-        standard_deviation = table[5]
-        position = table[7]
-        img_url = re.findall('src="(/hadassah/ChartImg.axd\\?.*?)"', website.text, re.DOTALL)[0]
-        img_website = self.__get(f'https://live.or-bit.net{img_url}')
+        grade, avg, standard_deviation, position, img_url = parse_grade_distribution(website.text)
+        img_website = await self.__get(f'{Internet.__ORBIT_HOST}{img_url}')
+        if img_website.status_code != 200:
+            return Res(False, warnings, Internet.Error.BOT_ERROR)
         img = img_website.content
         return Res(
             GradesDistribution(
@@ -532,77 +715,25 @@ class Internet:
         )
 
     @required_decorator(connect_orbit)
-    def get_time_table(self, _, warnings, semester: int = 1):
-        website = self.__get(Internet.__TIME_TABLE_URL)
+    async def get_time_table(self, _, warnings, semester: int = 1):
+        website = await self.__get(Internet.__TIME_TABLE_URL)
         if website.status_code != 200:
             return Res(False, warnings, Internet.Error.BOT_ERROR)
 
-        inputs = self.__get_hidden_inputs(website.text)
+        inputs = self.__get_hidden_inputs(website)
         inputs['ctl00$tbMain$ctl03$ddlPeriodTypeFilter2'] = semester
-        website = self.__post(Internet.__TIME_TABLE_URL, payload_data=inputs)
-
-        ans = re.findall(f"<tr id=\"ContentPlaceHolder1_PeriodScheduleA_gvPeriodSchedule\" class=\"GridRow\">.*?"
-                         "<td.*?>(.*?)</td>"
-                         "<td.*?>(.*?)</td>"
-                         "<td.*?>(.*?)</td>"
-                         "<td.*?>.*?</td>"
-                         "<td.*?>.*?</td>"
-                         "<td.*?>.*?</td>"
-                         "<td.*?>.*?</td>"
-                         "<td.*?>.*?</td>"
-                         "<td.*?>(.*?)</td>"
-                         "<td.*?>(.*?)</td>", website.text, re.DOTALL)
-        ans = [
-            (
-                my_class[2].replace('<br>', '\n'),
-                ["א'", "ב'", "ג'", "ד'", "ה'", "ו'"].index(my_class[0]),
-                int(my_class[1][0:2]) + int(my_class[1][3:5]) / 60,
-                int(my_class[1][6:8]) + int(my_class[1][9:11]) / 60,
-                my_class[3].replace('<br>', '\n') if my_class[3] != '&nbsp;' else '',
-                my_class[4].replace('<br>', '\n') if my_class[4] != '&nbsp;' else ''
-            )
-
-            for my_class in ans
-
-            if my_class[0] != '&nbsp;' and my_class[1] != '&nbsp;'
-        ]
+        website = await self.__post(Internet.__TIME_TABLE_URL, payload_data=inputs)
+
+        ans = parse_time_table(website.text)
         if ans:
             return Res((
                 ["semesterA.pdf", "semesterB.pdf", "semesterSummer.pdf"][semester - 1],
-                HebrewTimeTablePDF(ans).get_output()
+                await render_cache.cache.get_pdf(ans)
             ), warnings, None)
 
         return Res(None, warnings, None)
 
-    @staticmethod
-    def __get_grade_from_page(page: str, page_number: int) -> List[Grade]:
-        """
-        get grades from specific page
-        :param page: the page data (HTML code)
-        :param page_number: the page number
-        :return: a list of all Grades in the page
-        """
-        subjects_str = re.findall('<tr id="ContentPlaceHolder1_gvGradesList" class="GridRow">(.*?)</tr>',
-                                  page,
-                                  re.DOTALL)
-        final_res = []
-        for subject in subjects_str:
-            data = re.findall('<td.*?>(.*?)</td>', subject, re.DOTALL)
-            grade_distribution = re.search(
-                r'ctl00\$ContentPlaceHolder1\$gvGradesList\$GridRow([0-9]+?)\$imgShowGradeDistribution', data[6])
-            if grade_distribution:
-                grade_distribution = f'{page_number}_{grade_distribution.group(1)}'
-            final_res.append(
-                Grade(
-                    name=html.unescape(data[1]),
-                    units=int(data[4]),
-                    grade=re.findall('>(.*?)</span>', data[6])[0],
-                    grade_distribution=grade_distribution
-                )
-            )
-        return final_res
-
-    def __get(self, url: str, payload: dict = None) -> requests.Response:
+    async def __get(self, url: str, payload: dict = None) -> httpx.Response:
         """
         use the get function of the session
         :param url: the url to go to
@@ -613,12 +744,12 @@ class Internet:
             payload = '&' + urlencode(payload, quote_via=quote)
         else:
             payload = ''
-        return self.session.get(f"{url}{payload}")
+        return await self.__request('GET', f"{url}{payload}")
 
-    def __post(self, url: str,
-               payload_data: dict = None,
-               payload_json: Union[dict, list] = None,
-               get_payload: dict = None) -> requests.Response:
+    async def __post(self, url: str,
+                     payload_data: dict = None,
+                     payload_json: Union[dict, list] = None,
+                     get_payload: dict = None) -> httpx.Response:
         """
         use the post function of the session
         :param url: the url to go to
@@ -632,37 +763,62 @@ class Internet:
             get_payload = '?' + urlencode(get_payload, quote_via=quote)
         else:
             get_payload = ''
-        return self.session.post(f"{url}{get_payload}", data=payload_data, json=payload_json)
+        return await self.__request('POST', f"{url}{get_payload}", data=payload_data, json=payload_json)
 
-    def __get_hidden_inputs(self, text: str) -> dict:
+    async def __request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        send a request with the session, if the orbit or moodle session expired on the way,
+        login again and send the request one more time
+        :param method: the http method
+        :param url: the url to go to
+        :param kwargs: same as in the `session.request` parameters
+        :return: the Response of the session
+        """
+        response = await self.__send(method, url, **kwargs)
+        if self.orbit_res.result and str(response.url).split('?')[0] == Internet.__LOGIN_URL:
+            self.orbit_res = Res(False, [], None)
+            self.__cookies_loaded = False
+            if (await self.connect_orbit()).result:
+                response = await self.__send(method, url, **kwargs)
+        elif self.moodle_res.result and str(response.url).startswith(Internet.__MOODLE_LOGIN_URL):
+            self.moodle_res = Res(False, [], None)
+            self.__sesskey = None
+            self.__cookies_loaded = False
+            if (await self.connect_moodle()).result:
+                response = await self.__send(method, url, **kwargs)
+        recorder.record(self.user, response)
+        return response
+
+    async def __send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        send a request with the session and record its time and status (see `metrics`)
+        :param method: the http method
+        :param url: the url to go to
+        :param kwargs: same as in the `session.request` parameters
+        :return: the Response of the session
+        """
+        site = 'moodle' if url.startswith(Internet.__MOODLE_URL) else 'orbit'
+        start = time.perf_counter()
+        try:
+            with tracing.span(f'{method} {metrics.endpoint_of(url)}', site=site):
+                response = await self.session.request(method, url, **kwargs)
+        except httpx.HTTPError as error:
+            metrics.observe_request(site, url, time.perf_counter() - start, type(error).__name__)
+            raise
+        metrics.observe_request(site, url, time.perf_counter() - start, response.status_code)
+        return response
+
+    def __get_hidden_inputs(self, website: httpx.Response) -> dict:
         """
         get all hidden inputs from the website (include the year)
-        :param text: the html code
+        :param website: the response of the page
         :return: dict with all the hidden inputs and their values
         """
-        hidden_input_regex = r"<input type=\"hidden\" name=\"(.*?)\" id=\".*?\" value=\"(.*?)\" \/>"
-        hidden_inputs = re.findall(hidden_input_regex, text, re.DOTALL)
+        hidden_inputs, year = get_form(website)
+        hidden_inputs = dict(hidden_inputs)
         if self.user.year:
-            hidden_inputs.append(('ctl00$cmbActiveYear', self.user.year))
-        else:
-            year_regex = '<select name="ctl00\\$cmbActiveYear".*?<option selected="selected" value="([0-9]*?)"'
-            year = re.findall(year_regex, text, re.DOTALL)
-            if year:
-                year = int(year[0])
-                hidden_inputs.append(('ctl00$cmbActiveYear', year))
-
-        return dict(hidden_inputs)
-
-def get_short_name(name: str) -> str:
-    """
-    get the short name of the subject
-    :param name: the name of the subject
-    :return: the short name of the subject
-    """
-    i = 0
-    while i < len(name) and (name[i].isdigit() or name[i] == '-' or name[i] == ' '):
-        i += 1
-
-    return name[i:]
-
+            hidden_inputs['ctl00$cmbActiveYear'] = self.user.year
+        elif year is not None:
+            hidden_inputs['ctl00$cmbActiveYear'] = year
 
+        return hidden_inputs
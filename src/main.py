@@ -1,14 +1,18 @@
+import logging
+
+import metrics
 import telegram_bot
-import multiprocessing
 import scheduler
 
 
 def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    metrics.start_server()
     token = open('BotToken.txt').readline().strip()
-    scheduler_task = multiprocessing.Process(target=scheduler.schedule_messages, args=(token,))
-    scheduler_task.start()
-    telegram_bot.start_telegram_bot(token)
-    scheduler_task.close()
+    # the scheduled jobs run in the event loop of the bot
+    jobs = scheduler.JobRunner()
+    jobs.add_default_jobs()
+    telegram_bot.start_telegram_bot(token, on_start=jobs.start, on_stop=jobs.stop)
 
 
 if __name__ == '__main__':
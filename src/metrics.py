@@ -0,0 +1,69 @@
+import logging
+import os
+import re
+from urllib.parse import urlsplit
+
+from prometheus_client import Counter, Histogram, start_http_server
+
+# the metrics are served on http://METRICS_ADDRESS:METRICS_PORT/metrics (not served if METRICS_PORT is not set)
+METRICS_ADDRESS = os.environ.get('METRICS_ADDRESS', '127.0.0.1')
+METRICS_PORT = os.environ.get('METRICS_PORT')
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SECONDS = Histogram('orbit_moodle_request_seconds', 'requests to orbit and moodle', ['site', 'endpoint'])
+RESPONSES = Counter('orbit_moodle_responses', 'responses of orbit and moodle by the http status '
+                                              '(or the exception if there was no response)',
+                    ['site', 'endpoint', 'status'])
+ERRORS = Counter('orbit_moodle_errors', 'results of Internet functions with an Internet.Error', ['function', 'error'])
+TELEGRAM_REQUEST_SECONDS = Histogram('telegram_request_seconds', 'requests to telegram (without the time in the '
+                                                                 'send queue)', ['method'])
+COMMAND_SECONDS = Histogram('command_seconds', 'commands and buttons that use orbit or moodle', ['command'],
+                            buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60))
+JOB_SECONDS = Histogram('scheduled_job_seconds', 'runs of the scheduled jobs (a shard of the users every run)',
+                        ['job'], buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+JOB_USERS = Counter('scheduled_job_users', 'users processed by the scheduled jobs', ['job'])
+JOB_FAILURES = Counter('scheduled_job_failures', 'users the scheduled jobs failed for', ['job'])
+
+
+def start_server():
+    """
+    serve the metrics on METRICS_ADDRESS:METRICS_PORT (in a thread), if METRICS_PORT is set
+    :return:
+    """
+    if METRICS_PORT:
+        start_http_server(int(METRICS_PORT), METRICS_ADDRESS)
+        logger.info('metrics are served on http://%s:%s/metrics', METRICS_ADDRESS, METRICS_PORT)
+
+
+def endpoint_of(url: str) -> str:
+    """
+    :param url:
+    :return: the path of the url, without the numbers in it (so every chart image is not a new endpoint)
+    """
+    return re.sub(r'\d+', '{n}', re.sub('/+', '/', urlsplit(url).path))
+
+
+def observe_request(site: str, url: str, seconds: float, status):
+    """
+    record a request to orbit or moodle
+    :param site: orbit or moodle
+    :param url:
+    :param seconds: the time of the request
+    :param status: the http status of the response (or the name of the exception if there was no response)
+    :return:
+    """
+    endpoint = endpoint_of(url)
+    REQUEST_SECONDS.labels(site, endpoint).observe(seconds)
+    RESPONSES.labels(site, endpoint, str(status)).inc()
+
+
+def count_error(function: str, error):
+    """
+    count an Internet.Error result of an Internet function
+    :param function: the name of the function
+    :param error: the error of the result (nothing is counted if it is None)
+    :return:
+    """
+    if error:
+        ERRORS.labels(function, error.name).inc()
@@ -0,0 +1,262 @@
+import html
+import re
+from collections import namedtuple
+from datetime import datetime
+from typing import List, Optional
+
+import tracing
+
+Grade = namedtuple('Grade', 'name units grade grade_distribution')
+Exam = namedtuple('Exam', 'name period time_start time_end mark room notebook_url register cancel_register number')
+Event = namedtuple('event', 'course_short_name name course_name course_id end_time url')
+
+
+@tracing.traced
+def parse_years(page: str) -> List[str]:
+    """
+    get all the years that can be picked
+    :param page: the main page (HTML code)
+    :return: list of the years
+    """
+    years_regex = '<select name="ctl00\\$cmbActiveYear".*?</select'
+    year_regex = 'value="([0-9]*?)"'
+    years = re.findall(years_regex, page, re.DOTALL)[0]
+    return re.findall(year_regex, years, re.DOTALL)
+
+
+@tracing.traced
+def parse_moodle_redirect(page: str) -> Optional[str]:
+    """
+    get the url orbit redirect to in order to connect moodle
+    :param page: the Moodle.ashx page
+    :return: the url or None if not found
+    """
+    reg = re.search("URL='(.*?)'", page)
+    return reg[1] if reg else None
+
+
+@tracing.traced
+def parse_sesskey(page: str) -> Optional[str]:
+    """
+    get the session key of moodle
+    :param page: any moodle page (HTML code)
+    :return: the session key or None if not found
+    """
+    reg = re.search('"sesskey":"(.*?)"', page)
+    return reg[1] if reg else None
+
+
+@tracing.traced
+def parse_events(events: List[dict]) -> List[Event]:
+    """
+    get the events from the data of `core_calendar_get_action_events_by_timesort`
+    :param events: the `events` list in the data
+    :return: list of Events
+    """
+    return [Event(course_short_name=get_short_name(event['course']['shortname']),
+                  name=event['name'],
+                  course_name=event['course']['shortname'],
+                  course_id=event['course']['id'],
+                  end_time=datetime.fromtimestamp(event['timesort']),
+                  url=event['url'])
+            for event in events]
+
+
+@tracing.traced
+def parse_last_year_button(page: str) -> str:
+    """
+    get the name of the button of the last year in the set schedule page
+    :param page: the set schedule page (HTML code)
+    :return: the name of the button
+    """
+    return re.findall(r'ctl00\$ContentPlaceHolder1\$gvBalance\$GridRow[0-9]+?\$btnBalanceDataDetails',
+                      page,
+                      re.DOTALL)[-1]
+
+
+@tracing.traced
+def parse_lessons(page: str) -> List[tuple]:
+    """
+    get lesson that can be registered
+    :param page: the set schedule page of the last year (HTML code)
+    :return: list of (button name, lesson name, lesson code)
+    """
+    return re.findall(r'(ctl00\$ContentPlaceHolder1\$gvLinkToLessons\$GridRow[0-9]+?\$btnLinkStudentToLesson).*?'
+                      r'<table>\s*?<tr>\s*?<td>(.*?)</td>\s*?</tr>\s*?</table>\s*?</span>\s*?</td>\s*?<td valign'
+                      r'="top" nowrap="nowrap">\s*?<span id=".*?">(.*?)</span>', page, re.DOTALL)
+
+
+@tracing.traced
+def parse_lesson_button(page: str, code: str) -> Optional[str]:
+    """
+    get the registration button of one lesson, without parsing all the lessons
+    :param page: the set schedule page of the last year (HTML code)
+    :param code: the lesson code (as in `parse_lessons`)
+    :return: the button name (like in `parse_lessons`) or None if the lesson is not in the page
+    """
+    code_index = page.find(f'>{code}</span>')
+    if code_index == -1:
+        return None
+    # the button is in the first cell of the row of the code
+    button_end = page.rfind('$btnLinkStudentToLesson', 0, code_index)
+    button_start = page.rfind('ctl00$ContentPlaceHolder1$gvLinkToLessons$GridRow', 0, button_end)
+    if button_end == -1 or button_start == -1:
+        return None
+    return page[button_start:button_end + len('$btnLinkStudentToLesson')]
+
+
+@tracing.traced
+def parse_grade_page_links(page: str) -> List[int]:
+    """
+    get the numbers of the pages the pager of the grades list links to (all the pages but the current one)
+    :param page: a page of the grades list (HTML code)
+    :return: the page numbers
+    """
+    pages_regex = 'javascript:__doPostBack\\(&#39;ctl00\\' \
+                  '$ContentPlaceHolder1\\$gvGradesList&#39;,&#39;Page\\$([1-9])&#39;\\)'
+    return [int(number) for number in re.findall(pages_regex, page)]
+
+
+@tracing.traced
+def parse_grade_pages_count(page: str) -> int:
+    """
+    get the number of pages in the grades list
+    :param page: the first page of the grades list (HTML code)
+    :return: the number of pages
+    """
+    return len(parse_grade_page_links(page)) + 1
+
+
+@tracing.traced
+def parse_grades(page: str, page_number: int) -> List[Grade]:
+    """
+    get grades from specific page
+    :param page: the page data (HTML code)
+    :param page_number: the page number
+    :return: a list of all Grades in the page
+    """
+    subjects_str = re.findall('<tr id="ContentPlaceHolder1_gvGradesList" class="GridRow">(.*?)</tr>',
+                              page,
+                              re.DOTALL)
+    final_res = []
+    for subject in subjects_str:
+        data = re.findall('<td.*?>(.*?)</td>', subject, re.DOTALL)
+        grade_distribution = re.search(
+            r'ctl00\$ContentPlaceHolder1\$gvGradesList\$GridRow([0-9]+?)\$imgShowGradeDistribution', data[6])
+        if grade_distribution:
+            grade_distribution = f'{page_number}_{grade_distribution.group(1)}'
+        final_res.append(
+            Grade(
+                name=html.unescape(data[1]),
+                units=int(data[4]),
+                grade=re.findall('>(.*?)</span>', data[6])[0],
+                grade_distribution=grade_distribution
+            )
+        )
+    return final_res
+
+
+@tracing.traced
+def parse_exams(page: str) -> List[Exam]:
+    """
+    get list of the user's exams
+    :param page: the exams page (HTML code)
+    :return: list of the user's exams
+    """
+    all_exams_text = re.findall(
+        '<tr id="ContentPlaceHolder1_gvStudentAssignmentTermList" class="GridRow">(?:.*?)*</tr>',
+        page,
+        re.DOTALL)
+    all_exams_text = [re.findall('<td.*?>(.*?)</td>', exam, re.DOTALL) for exam in all_exams_text]
+
+    all_exams = []
+    for index, exam in enumerate(all_exams_text):
+        name = exam[10]
+        time = re.search('>([^>]*?)</span', exam[2]).group(1).split('-')
+        if len(time) < 2:
+            time = ['00:00', '00:00']
+        if exam[0] == '&nbsp;':
+            exam[0] = '01/01/0001'
+        time_start = datetime.strptime(f"{exam[0]} {time[0]}", '%d/%m/%Y %H:%M')
+        time_end = datetime.strptime(f"{exam[0]} {time[1]}", '%d/%m/%Y %H:%M')
+        period = exam[4]
+        mark = None if exam[5] == '&nbsp;' else exam[5]
+        room = '' if exam[7] == '&nbsp;' else exam[7]
+        notebook = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}$btnDownload"' in exam[13]
+        register = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}$' \
+                   f'btnRequestExamAssign"' in exam[12]
+        cancel_register = f'ctl00$ContentPlaceHolder1$gvStudentAssignmentTermList$GridRow{index}' \
+                          f'$btnRequestExamAssignCancel"' in exam[12]
+
+        all_exams.append(Exam(name=name,
+                              period=period,
+                              time_start=time_start,
+                              time_end=time_end,
+                              mark=mark,
+                              room=room,
+                              notebook_url=notebook,
+                              register=register,
+                              cancel_register=cancel_register,
+                              number=index))
+    return all_exams
+
+
+@tracing.traced
+def parse_grade_distribution(page: str) -> tuple:
+    """
+    get the statistics of the grade distribution of a subject
+    :param page: the grades list page with the distribution open (HTML code)
+    :return: (grade, average, standard deviation, position, url of the chart image)
+    """
+    table = re.findall('<span id="ContentPlaceHolder1_ucLessonGradeDistribution_lblStatData"><table>(.*?)</table>',
+                       page, re.DOTALL)[0]
+    table = re.findall('<td.*?>(.*?)</td>', table, re.DOTALL)
+    img_url = re.findall('src="(/hadassah/ChartImg.axd\\?.*?)"', page, re.DOTALL)[0]
+    return table[1], table[3], table[5], table[7], img_url
+
+
+@tracing.traced
+def parse_time_table(page: str) -> List[tuple]:
+    """
+    get the classes of the time table
+    :param page: the time table page (HTML code)
+    :return: list of (name, day, start hour, end hour, lecturer, room)
+    """
+    ans = re.findall(f"<tr id=\"ContentPlaceHolder1_PeriodScheduleA_gvPeriodSchedule\" class=\"GridRow\">.*?"
+                     "<td.*?>(.*?)</td>"
+                     "<td.*?>(.*?)</td>"
+                     "<td.*?>(.*?)</td>"
+                     "<td.*?>.*?</td>"
+                     "<td.*?>.*?</td>"
+                     "<td.*?>.*?</td>"
+                     "<td.*?>.*?</td>"
+                     "<td.*?>.*?</td>"
+                     "<td.*?>(.*?)</td>"
+                     "<td.*?>(.*?)</td>", page, re.DOTALL)
+    return [
+        (
+            my_class[2].replace('<br>', '\n'),
+            ["א'", "ב'", "ג'", "ד'", "ה'", "ו'"].index(my_class[0]),
+            int(my_class[1][0:2]) + int(my_class[1][3:5]) / 60,
+            int(my_class[1][6:8]) + int(my_class[1][9:11]) / 60,
+            my_class[3].replace('<br>', '\n') if my_class[3] != '&nbsp;' else '',
+            my_class[4].replace('<br>', '\n') if my_class[4] != '&nbsp;' else ''
+        )
+
+        for my_class in ans
+
+        if my_class[0] != '&nbsp;' and my_class[1] != '&nbsp;'
+    ]
+
+
+def get_short_name(name: str) -> str:
+    """
+    get the short name of the subject
+    :param name: the name of the subject
+    :return: the short name of the subject
+    """
+    i = 0
+    while i < len(name) and (name[i].isdigit() or name[i] == '-' or name[i] == ' '):
+        i += 1
+
+    return name[i:]
@@ -0,0 +1,80 @@
+import json
+import os
+import re
+import time
+from urllib.parse import quote, urlsplit
+
+import httpx
+
+import database
+
+# when set, every orbit/moodle response is saved (anonymized) to this dir, to be used as a fixture
+RECORD_DIR = os.environ.get('ORBIT_RECORD_DIR')
+INDEX_FILE = 'index.jsonl'
+
+__RECORDED_TYPES = ('text/html', 'application/json', 'text/plain')
+# (pattern, replacement) of the personal data in orbit and moodle pages
+__PERSONAL_DATA = [
+    # the moodle session key
+    (re.compile(rb'"sesskey":"[^"]*"'), rb'"sesskey":"0000000000"'),
+    (re.compile(rb'([?&;]sesskey=)\w+'), rb'\g<1>0000000000'),
+    # the asp.net state (__VIEWSTATE, __EVENTVALIDATION and the other hidden inputs) is base64 of the page data,
+    # that has the id and the name of the student
+    (re.compile(rb'(<input type="hidden"[^>]*? value=")[^"]*"'), rb'\1"'),
+    # the name of the student in the header of orbit, and the name of the user in the menu of moodle
+    (re.compile(rb'(<span id="[^"]*(?:Student|User)[^"]*Name[^"]*"[^>]*>)[^<]*', re.IGNORECASE), rb'\1XXXX'),
+    (re.compile(rb'(<span class="usertext[^"]*"[^>]*>)[^<]*'), rb'\1XXXX'),
+    # the name, the e-mail and the id of the user in the json of moodle
+    (re.compile(rb'"(fullname|firstname|lastname|email|userfullname)":"(?:[^"\\]|\\.)*"'), rb'"\1":"XXXX"'),
+    (re.compile(rb'"(userid\w*|userId)":"?\d+"?'), rb'"\1":0'),
+    # the ids of the user in the links of moodle
+    (re.compile(rb'(user/(?:profile|view)\.php\?(?:[^"\'\s]*?&(?:amp;)?)?id=)\d+'), rb'\g<1>0'),
+    (re.compile(rb'([?&;]userid=)\d+'), rb'\g<1>0'),
+    # any other e-mail
+    (re.compile(rb'[\w.+-]+@[\w-]+(?:\.[\w-]+)+'), rb'xxxx@example.com'),
+]
+
+
+def __anonymize(content: bytes, user: database.User) -> bytes:
+    """
+    remove the username, the password, the moodle session key, the asp.net state and the personal data we know of
+    (names, e-mails and moodle user ids) from a page
+    :param content: the raw page
+    :param user: the user the page belongs to
+    :return: the anonymized page
+    """
+    for secret in (user.user_name, user.password):
+        if not secret:
+            continue
+        for form in {secret, quote(secret)}:
+            content = content.replace(form.encode('utf-8'), b'X' * len(form))
+    for pattern, replacement in __PERSONAL_DATA:
+        content = pattern.sub(replacement, content)
+    return content
+
+
+def record(user: database.User, response: httpx.Response):
+    """
+    save the response in `RECORD_DIR` (do nothing if `RECORD_DIR` is not set)
+    only text responses are saved, files like documents and notebooks are skipped
+    :param user: the user the response belongs to
+    :param response: the response to save
+    """
+    if not RECORD_DIR:
+        return
+    content_type = response.headers.get('content-type', '')
+    if not content_type.startswith(__RECORDED_TYPES):
+        return
+
+    os.makedirs(RECORD_DIR, exist_ok=True)
+    path = urlsplit(str(response.url)).path
+    extension = 'json' if 'json' in content_type else 'html'
+    file_name = f'{time.time_ns()}_{response.request.method}_{os.path.basename(path.rstrip("/")) or "index"}.' \
+                f'{extension}'
+    with open(os.path.join(RECORD_DIR, file_name), 'wb') as file:
+        file.write(__anonymize(response.content, user))
+    with open(os.path.join(RECORD_DIR, INDEX_FILE), 'a', encoding='utf-8') as index:
+        index.write(json.dumps({'file': file_name,
+                                'method': response.request.method,
+                                'path': path,
+                                'status': response.status_code}) + '\n')
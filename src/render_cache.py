@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, List
+
+import tracing
+
+# the rendered time tables are kept in this dir, named by the hash of the time table
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', 'render_cache')
+MEMORY_CACHE_SIZE = 64
+# the most files kept in RENDER_CACHE_DIR, the least recently used files above that are deleted
+DISK_CACHE_SIZE = int(os.environ.get('RENDER_CACHE_FILES', '2000'))
+# change when the layout of the pdf changes, so the old files are not used
+RENDER_VERSION = 1
+
+
+class RenderCache:
+    """
+    content addressed cache of the time table pdf files.
+    the key is a hash of the parsed classes, so users with the same time table share the same file.
+    the last used files are kept in memory, and the last `disk_size` used files are kept in `directory`
+    (the modification time of a file is the time it was last used)
+    """
+
+    def __init__(self,
+                 directory: str = RENDER_CACHE_DIR,
+                 memory_size: int = MEMORY_CACHE_SIZE,
+                 disk_size: int = DISK_CACHE_SIZE):
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.__memory: OrderedDict[str, bytes] = OrderedDict()
+        self.__rendering: Dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def key(time_table: List[tuple]) -> str:
+        """
+        :param time_table: list of (name, day, start hour, end hour, lecturer, room)
+        :return: the hash of the time table
+        """
+        canonical = json.dumps([RENDER_VERSION, [list(my_class) for my_class in time_table]], ensure_ascii=False)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    async def get_pdf(self, time_table: List[tuple]) -> bytes:
+        """
+        get the pdf of a time table, render it only if it is not in the cache
+        :param time_table: list of (name, day, start hour, end hour, lecturer, room)
+        :return: the pdf file
+        """
+        key = self.key(time_table)
+        if key in self.__memory:
+            self.__memory.move_to_end(key)
+            return self.__memory[key]
+
+        # the same time table is rendered only once even if it is asked by many users at the same time
+        task = self.__rendering.get(key)
+        if not task:
+            task = asyncio.create_task(asyncio.to_thread(self.__load_or_render, key, time_table))
+            self.__rendering[key] = task
+            task.add_done_callback(lambda _: self.__rendering.pop(key, None))
+        pdf = await asyncio.shield(task)
+
+        self.__memory[key] = pdf
+        if len(self.__memory) > self.memory_size:
+            self.__memory.popitem(last=False)
+        return pdf
+
+    def __load_or_render(self, key: str, time_table: List[tuple]) -> bytes:
+        path = os.path.join(self.directory, f'{key}.pdf')
+        try:
+            with open(path, 'rb') as file:
+                pdf = file.read()
+        except FileNotFoundError:
+            # not rendered yet (or deleted by `__evict`)
+            pdf = None
+        if pdf is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return pdf
+
+        # pillow, fpdf2 and the font take most of the import time of the bot, they are loaded on the first render
+        from time_table_to_pdf import HebrewTimeTablePDF
+        with tracing.span('render time table'):
+            pdf = HebrewTimeTablePDF(time_table).get_output()
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, so a half written file is never read
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(pdf)
+        os.replace(temp_path, path)
+        self.__evict()
+        return pdf
+
+    def __evict(self):
+        """
+        delete the least recently used files above `disk_size`
+        (old versions of the layout and time tables that changed are never used again, so they are deleted at the end)
+        """
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.pdf'):
+                        files.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    # deleted by another process
+                    pass
+        if len(files) <= self.disk_size:
+            return
+        files.sort()
+        for _, path in files[:len(files) - self.disk_size]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+cache = RenderCache()
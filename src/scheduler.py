@@ -1,46 +1,111 @@
+import argparse
 import asyncio
 import datetime
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
 import schedule
-import telegram
+from telegram.ext import Application, ExtBot
+
 import database
-import internet
-import time
+import grade_poller
+import metrics
 import telegram_bot
+import workers
+from send_queue import SendQueue, Priority
+from session_pool import pool
+from workers import RunStats
+
+# the maximum number of users that are logged in to orbit/moodle at the same time in a scheduled run
+MAX_CONCURRENT_LOGINS = 20
+# how often the grades job looks for users whose grades are due to be checked
+GRADES_CHECK_MINUTES = 10
+# the number of shards the users of a new run are split to (all the workers should use the same number)
+SCHEDULER_SHARDS = int(os.environ.get('SCHEDULER_SHARDS', '1'))
+# a shard whose worker did not send a heartbeat for that long is taken by another worker
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 15
+
+logger = logging.getLogger(__name__)
 
 
-async def async_send_messages(token, all_users, time_scope):
-    await asyncio.gather(*[send_scheduled_event(token, user, time_scope) for user in all_users])
+async def run_for_users(bot: ExtBot,
+                        all_users: Iterable[database.User],
+                        job: Callable[[ExtBot, database.User], Awaitable[bool]],
+                        max_concurrent_logins: int = MAX_CONCURRENT_LOGINS) -> RunStats:
+    """
+    run a job for all the users, at most `max_concurrent_logins` users are handled at the same time
+    (see `workers.run_for_users`)
+    :param bot: the bot to send the messages with
+    :param all_users: the users to run the job for
+    :param job: async function that gets the bot and a user, and returns is the job succeeded
+    :param max_concurrent_logins: the number of users handled at the same time
+    :return: the stats of the run
+    """
+    return await workers.run_for_users(bot, all_users, job, max_concurrent_logins)
+
+
+async def async_send_messages(bot: ExtBot,
+                              all_users: Iterable[database.User],
+                              time_scope: datetime.datetime,
+                              max_concurrent_logins: int = MAX_CONCURRENT_LOGINS) -> RunStats:
+    """
+    send the unfinished events to all the users
+    :param bot: the bot to send the messages with
+    :param all_users: the users to send to
+    :param time_scope: events that past that date are not sent
+    :param max_concurrent_logins: the number of users handled at the same time
+    :return: the stats of the run
+    """
+    async def send_events(bot_: ExtBot, user: database.User) -> bool:
+        return await send_scheduled_event(bot_, user, time_scope)
+
+    return await run_for_users(bot, all_users, send_events, max_concurrent_logins)
 
 
-def once_a_day(token: str):
-    all_users = database.get_users_by_schedule(1)
+async def once_a_day(bot: ExtBot, shard: Optional[database.Shard] = None) -> RunStats:
+    all_users = database.get_users_by_schedule(1, shard)
     time_scope = datetime.datetime.now() + datetime.timedelta(days=1)
-    asyncio.run(async_send_messages(token, all_users, time_scope))
+    return await async_send_messages(bot, all_users, time_scope)
 
 
-def once_a_week(token: str):
-    all_users = database.get_users_by_schedule(2)
+async def once_a_week(bot: ExtBot, shard: Optional[database.Shard] = None) -> RunStats:
+    all_users = database.get_users_by_schedule(2, shard)
     time_scope = datetime.datetime.now() + datetime.timedelta(days=7)
-    asyncio.run(async_send_messages(token, all_users, time_scope))
+    return await async_send_messages(bot, all_users, time_scope)
+
+
+async def check_grades(bot: ExtBot, shard: Optional[database.Shard] = None) -> RunStats:
+    """
+    send the new grades to the users whose grades are due to be checked
+    :param bot:
+    :param shard: only the users of that shard (None for all the users)
+    :return:
+    """
+    return await run_for_users(bot, grade_poller.due_users(shard), grade_poller.poll_user)
 
 
-async def send_scheduled_event(token: str, user: database.User, time_scope: datetime.datetime):
+async def send_scheduled_event(bot: ExtBot, user: database.User, time_scope: datetime.datetime) -> bool:
     """
     send the unfinished events by the given time scope
-    :param token:
+    :param bot:
     :param user:
     :param time_scope:
-    :return:
+    :return: is the events sent successfully
     """
-    bot = telegram.Bot(token)
-    unfinished_events = internet.Internet(user.user_name, user.password).get_unfinished_events(time_scope)
+    async with pool.session(user) as user_internet:
+        unfinished_events = await user_internet.get_unfinished_events(time_scope)
+    metrics.count_error('get_unfinished_events', unfinished_events.error)
     if not unfinished_events:
-        return
+        return False
     if unfinished_events.warnings:
         await telegram_bot.handle_warnings(unfinished_events.warnings, bot, user.user_id)
     if unfinished_events.error:
         await telegram_bot.handle_error(unfinished_events.error, bot, user.user_id)
-        return
+        return False
     events = unfinished_events.result
     events_text = "no events"
     if events:
@@ -50,18 +115,207 @@ async def send_scheduled_event(token: str, user: database.User, time_scope: date
                                                                                f'{event.url}'
                                                                                for event in events)
 
-    await bot.send_message(chat_id=user.user_id, text=events_text)
+    await bot.send_message(chat_id=user.user_id, text=events_text, rate_limit_args=Priority.DIGEST)
+    return True
+
+
+Job = Callable[[ExtBot, Optional[database.Shard]], Awaitable]
 
 
-def schedule_messages(token: str):
+class JobRunner:
     """
-    schedule sending the messages and call the scheduled jobs
-    :param token:
+    runs the scheduled jobs as tasks in the event loop of the bot,
+    so the jobs share the bot (and its send queue) and the session pool with the commands of the users.
+    a job that is still running when it is due again is skipped.
+
+    every runner is a worker: a run of a job is split to shards of users, and the workers (the bot and any number of
+    `python scheduler.py` processes on the same database) lease the shards of the run from the database
+    until all of them are done. a worker sends heartbeats while it runs a shard,
+    so the shard of a worker that died is leased again by another worker
+    """
+
+    def __init__(self, shards: int = SCHEDULER_SHARDS, owner: str = None):
+        """
+        :param shards: the number of shards of a run
+        :param owner: the name of the worker in the leases (the host and the pid by default)
+        """
+        self.scheduler = schedule.Scheduler()
+        self.bot = None
+        self.shards = shards
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.__running: Dict[str, asyncio.Task] = {}
+        self.__ticker = None
+
+    def add_job(self, job: schedule.Job, function: Job):
+        """
+        :param job: when to run the function (like `runner.scheduler.every().day.at("06:00")`)
+        :param function: async function that gets the bot and the shard of the users to handle
+        :return:
+        """
+        job.do(self.__start_job, function, job)
+
+    def add_default_jobs(self):
+        self.add_job(self.scheduler.every().day.at("06:00"), once_a_day)
+        self.add_job(self.scheduler.every().sunday.at("06:00"), once_a_week)
+        # every user is checked only once in `grade_poller.poll_interval`
+        self.add_job(self.scheduler.every(GRADES_CHECK_MINUTES).minutes, check_grades)
+
+    async def start(self, application: Application):
+        """
+        start running the jobs (used as the `post_init` of the bot application)
+        :param application:
+        :return:
+        """
+        self.start_with_bot(application.bot)
+
+    def start_with_bot(self, bot: ExtBot):
+        """
+        start running the jobs (in the running event loop)
+        :param bot: the bot to send the messages with
+        :return:
+        """
+        self.bot = bot
+        self.__ticker = asyncio.create_task(self.__tick())
+
+    async def stop(self, _=None):
+        """
+        cancel the running jobs
+        :return:
+        """
+        tasks = [task for task in (self.__ticker, *self.__running.values()) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.__ticker = None
+
+    async def __tick(self):
+        while True:
+            self.scheduler.run_pending()
+            await asyncio.sleep(1)
+
+    def __start_job(self, function: Job, job: schedule.Job):
+        name = function.__name__
+        if name in self.__running:
+            logger.warning('%s is still running, skipped', name)
+            return
+        # the job is called before its next run is scheduled, so `next_run` is the time the run was due.
+        # the workers that are due in the same period run the same run
+        run = int(job.next_run.timestamp() // job.period.total_seconds())
+        task = asyncio.create_task(self.__run_shards(function, run))
+        self.__running[name] = task
+        task.add_done_callback(lambda _: self.__job_done(name, task))
+
+    async def __run_shards(self, function: Job, run: int):
+        """
+        run the shards of the run until all of them are done (by this worker or by others)
+        :param function:
+        :param run:
+        :return:
+        """
+        name = function.__name__
+        while True:
+            shard = database.claim_shard(name, run, self.shards, self.owner, LEASE_SECONDS)
+            if shard:
+                if not await self.__run_shard(function, run, shard):
+                    # another worker took the shard, so this worker is too slow to take more of the run
+                    return
+            elif database.unfinished_shards(name, run):
+                # the other shards are leased by other workers, wait in case one of them dies
+                await asyncio.sleep(HEARTBEAT_SECONDS)
+            else:
+                return
+
+    async def __run_shard(self, function: Job, run: int, shard: database.Shard) -> bool:
+        """
+        run a leased shard, and send heartbeats while it runs
+        :param function:
+        :param run:
+        :param shard:
+        :return: False if the lease was lost before the shard was done
+        """
+        name = function.__name__
+        logger.info('%s: shard %d/%d of run %d', name, shard.index, shard.count, run)
+        start = time.monotonic()
+        task = asyncio.create_task(function(self.bot, shard))
+        try:
+            while not (await asyncio.wait([task], timeout=HEARTBEAT_SECONDS))[0]:
+                if not database.renew_lease(name, run, shard, self.owner):
+                    logger.warning('%s: lost the lease of shard %d of run %d', name, shard.index, run)
+                    return False
+        finally:
+            # a stopped worker leaves its shard to the other workers
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        metrics.JOB_SECONDS.labels(name).observe(time.monotonic() - start)
+        if task.exception():
+            # a failed shard is done too, it is not retried by the other workers
+            logger.error('%s: shard %d of run %d failed', name, shard.index, run, exc_info=task.exception())
+        elif isinstance(task.result(), RunStats):
+            metrics.JOB_USERS.labels(name).inc(task.result().users)
+            metrics.JOB_FAILURES.labels(name).inc(task.result().failures)
+        return database.finish_shard(name, run, shard, self.owner)
+
+    def __job_done(self, name: str, task: asyncio.Task):
+        del self.__running[name]
+        if not task.cancelled() and task.exception():
+            logger.error('%s failed', name, exc_info=task.exception())
+
+
+def run_job(token: str, function: Job):
+    """
+    run one job now for all the users, without the bot and without leases (for example from cron)
+    :param token: the token of the bot
+    :param function: async function that gets the bot and the shard of the users
+    :return: the result of the function
+    """
+    async def run():
+        try:
+            async with ExtBot(token, base_url=telegram_bot.TELEGRAM_API_URL, rate_limiter=SendQueue()) as bot:
+                return await function(bot)
+        finally:
+            await pool.close()
+
+    return asyncio.run(run())
+
+
+def run_worker(token: str, runner: JobRunner):
+    """
+    run the jobs of the runner without the bot, until the process is stopped
+    :param token: the token of the bot
+    :param runner:
     :return:
     """
-    schedule.every().day.at("06:00").do(once_a_day, token)
-    schedule.every().sunday.at("06:00").do(once_a_week, token)
+    async def run():
+        try:
+            async with ExtBot(token, base_url=telegram_bot.TELEGRAM_API_URL, rate_limiter=SendQueue()) as bot:
+                runner.start_with_bot(bot)
+                await asyncio.Event().wait()
+        finally:
+            await runner.stop()
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='a scheduler worker, it shares the runs of the scheduled jobs '
+                                                 'with the bot and the other workers on the same database')
+    parser.add_argument('--shards', type=int, default=SCHEDULER_SHARDS,
+                        help='the number of shards of a run (the same in all the workers)')
+    parser.add_argument('--owner', help='the name of the worker (the host and the pid by default)')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    metrics.start_server()
+    token = open('BotToken.txt').readline().strip()
+    runner = JobRunner(args.shards, args.owner)
+    runner.add_default_jobs()
+    try:
+        run_worker(token, runner)
+    except KeyboardInterrupt:
+        pass
+
 
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+if __name__ == '__main__':
+    main()
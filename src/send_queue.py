@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter, Forbidden, BadRequest
+from telegram.ext import BaseRateLimiter, ExtBot
+
+import database
+import metrics
+import tracing
+import workers
+
+# telegram allows about 30 messages per second for the whole bot, and about one message per second in a chat
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+MAX_RETRIES = 5
+# the number of messages of a broadcast that wait in the queue at the same time (enough to use the global rate)
+BROADCAST_CONCURRENCY = 2 * GLOBAL_RATE
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """
+    the priority of a request in the queue (lower goes first),
+    pass it as the `rate_limit_args` of the bot methods
+    """
+    INTERACTIVE = 0
+    DIGEST = 1
+    BROADCAST = 2
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """
+        :return: the seconds until there is a token in the bucket (0 if there is one now)
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class SendQueue(BaseRateLimiter[int]):
+    """
+    rate limiter for all the requests of the bot that are sent to a chat.
+    every request waits for a token of its chat bucket and then for a token of the global bucket,
+    the global tokens are given by priority (interactive replies before digests before broadcasts).
+    on `RetryAfter` all the requests wait the time telegram asked, and the request is sent again.
+    """
+
+    def __init__(self,
+                 global_rate: float = GLOBAL_RATE,
+                 chat_rate: float = CHAT_RATE,
+                 chat_burst: int = CHAT_BURST,
+                 max_retries: int = MAX_RETRIES):
+        self.__global = TokenBucket(global_rate, global_rate)
+        self.__chat_rate = chat_rate
+        self.__chat_burst = chat_burst
+        self.__chats: Dict[Union[int, str], TokenBucket] = {}
+        self.__max_retries = max_retries
+        self.__waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.__counter = itertools.count()
+        self.__dispatcher: Optional[asyncio.Task] = None
+        self.__paused_until = 0.0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        if self.__dispatcher:
+            self.__dispatcher.cancel()
+            self.__dispatcher = None
+
+    async def process_request(self,
+                              callback: Callable[..., Coroutine[Any, Any, Union[bool, dict, List[dict]]]],
+                              args: Any,
+                              kwargs: Dict[str, Any],
+                              endpoint: str,
+                              data: Dict[str, Any],
+                              rate_limit_args: Optional[int]) -> Union[bool, dict, List[dict]]:
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # getUpdates, answerCallbackQuery and so on are not limited
+            return await SendQueue.__timed(callback, args, kwargs, endpoint)
+
+        priority = Priority.INTERACTIVE if rate_limit_args is None else rate_limit_args
+        for retry in range(self.__max_retries + 1):
+            await self.__acquire(priority, chat_id)
+            try:
+                return await SendQueue.__timed(callback, args, kwargs, endpoint)
+            except RetryAfter as error:
+                if retry == self.__max_retries:
+                    raise
+                logger.info('%s hit the flood limit, retrying after %s seconds', endpoint, error.retry_after)
+                self.__paused_until = max(self.__paused_until, time.monotonic() + error.retry_after)
+
+    @staticmethod
+    async def __timed(callback: Callable[..., Coroutine], args: Any, kwargs: Dict[str, Any], endpoint: str):
+        start = time.perf_counter()
+        try:
+            with tracing.span(f'telegram {endpoint}'):
+                return await callback(*args, **kwargs)
+        finally:
+            metrics.TELEGRAM_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+
+    async def __acquire(self, priority: int, chat_id: Union[int, str]):
+        bucket = self.__chat_bucket(chat_id)
+        while (wait_time := bucket.wait_time()) > 0:
+            await asyncio.sleep(wait_time)
+        bucket.take()
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.__waiters, (priority, next(self.__counter), future))
+        if not self.__dispatcher:
+            self.__dispatcher = asyncio.create_task(self.__dispatch())
+        await future
+
+    async def __dispatch(self):
+        """
+        give the global tokens to the waiting requests, by priority
+        """
+        try:
+            while self.__waiters:
+                wait_time = max(self.__paused_until - time.monotonic(), self.__global.wait_time())
+                if wait_time > 0:
+                    await asyncio.sleep(wait_time)
+                    continue
+                _, _, future = heapq.heappop(self.__waiters)
+                if not future.done():
+                    self.__global.take()
+                    future.set_result(None)
+        finally:
+            self.__dispatcher = None
+
+    def __chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        if chat_id not in self.__chats:
+            if len(self.__chats) > 1000:
+                # forget the chats that have a full bucket
+                self.__chats = {chat: bucket for chat, bucket in self.__chats.items()
+                                if bucket.wait_time() > 0 or bucket.tokens < bucket.capacity}
+            self.__chats[chat_id] = TokenBucket(self.__chat_rate, self.__chat_burst)
+        return self.__chats[chat_id]
+
+
+async def broadcast(bot: ExtBot, text: str, concurrency: int = BROADCAST_CONCURRENCY) -> Tuple[int, int]:
+    """
+    send a message to all the users in the database, at the highest rate the send queue of the bot allows.
+    the users are streamed from the database, and at most `concurrency` messages are sent at the same time
+    :param bot: bot with a `SendQueue`
+    :param text: the message
+    :param concurrency: the number of messages sent at the same time
+    :return: (number of users the message sent to, number of users it failed to send to)
+    """
+    async def send_broadcast(bot_: ExtBot, user) -> bool:
+        try:
+            await bot_.send_message(chat_id=user.user_id, text=text, rate_limit_args=Priority.BROADCAST)
+            return True
+        except (Forbidden, BadRequest):
+            # the user blocked the bot or deleted the chat
+            return False
+
+    stats = await workers.run_for_users(bot, database.iter_users(columns=('user_id',)), send_broadcast, concurrency)
+    return stats.users - stats.failures, stats.failures
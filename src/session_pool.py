@@ -0,0 +1,106 @@
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import connection_pool
+import database
+from internet import Internet
+
+SESSION_TTL = 15 * 60
+MAX_SESSIONS = 500
+
+
+class _PoolEntry:
+    """
+    a logged-in session with the lock that make sure only one command use it at a time
+    """
+
+    def __init__(self, user: database.User):
+        self.internet = Internet(user)
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    """
+    process wide pool of logged-in `Internet` sessions, keyed by the user id.
+    a session that was not used for `ttl` seconds is closed,
+    and when there are more than `max_sessions` sessions the least recently used one is closed.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.__sessions: OrderedDict[int, _PoolEntry] = OrderedDict()
+        self.__closing = set()
+
+    @asynccontextmanager
+    async def session(self, user: database.User) -> AsyncIterator[Internet]:
+        """
+        get the session of the user (create one if needed), the session is locked until the context ends
+        :param user: the user that need the session
+        :return: `Internet` object of the user
+        """
+        self.__evict_expired()
+        entry = self.__sessions.get(user.user_id)
+        if entry and SessionPool.__login_info(entry.internet.user) != SessionPool.__login_info(user):
+            # the username, password or year changed, the old session is useless (and its cookies too)
+            self.__evict(user.user_id, save=False)
+            entry = None
+        if not entry:
+            entry = _PoolEntry(user)
+            self.__sessions[user.user_id] = entry
+        self.__sessions.move_to_end(user.user_id)
+        while len(self.__sessions) > self.max_sessions:
+            self.__evict(next(iter(self.__sessions)))
+
+        async with entry.lock:
+            try:
+                yield entry.internet
+            finally:
+                entry.last_used = time.monotonic()
+
+    def invalidate(self, user_id: int):
+        """
+        close the session of a user (if exist)
+        :param user_id: the id of the user
+        """
+        if user_id in self.__sessions:
+            self.__evict(user_id)
+
+    async def close(self):
+        """
+        close all the sessions in the pool, and the connections they shared
+        """
+        entries = list(self.__sessions.values())
+        self.__sessions.clear()
+        await asyncio.gather(*[SessionPool.__close_entry(entry) for entry in entries], *self.__closing)
+        await connection_pool.transport.close()
+
+    @staticmethod
+    def __login_info(user: database.User):
+        return user.user_name, user.password, user.year
+
+    def __evict_expired(self):
+        now = time.monotonic()
+        expired = [user_id for user_id, entry in self.__sessions.items()
+                   if now - entry.last_used > self.ttl and not entry.lock.locked()]
+        for user_id in expired:
+            self.__evict(user_id)
+
+    def __evict(self, user_id: int, save: bool = True):
+        entry = self.__sessions.pop(user_id)
+        task = asyncio.get_running_loop().create_task(SessionPool.__close_entry(entry, save))
+        self.__closing.add(task)
+        task.add_done_callback(self.__closing.discard)
+
+    @staticmethod
+    async def __close_entry(entry: _PoolEntry, save: bool = True):
+        # wait for the command that use the session (if any) to finish
+        async with entry.lock:
+            await entry.internet.close(save)
+
+
+pool = SessionPool()
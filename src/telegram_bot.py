@@ -1,26 +1,49 @@
 import datetime
-from typing import List
+import functools
+import os
+import time
+from urllib.parse import urlsplit
+from typing import Awaitable, Callable, List
 from enum import Enum, auto
 
 
 import telegram
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, ConversationHandler, MessageHandler, \
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, CommandHandler, ConversationHandler, MessageHandler, \
     filters, CallbackQueryHandler
 
-from internet import Internet, Document, documents_heb_name, documents_file_name
+from connection_pool import HTTP_WARM_UP_CONNECTIONS
+from internet import Internet, Document, documents_heb_name, documents_file_name, grade_distribution_key
+from send_queue import SendQueue
+from session_pool import pool
+from update_processor import ChatUpdateProcessor
 import database
+import grade_poller
+import metrics
+import tracing
+
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org/bot')
+# if TELEGRAM_WEBHOOK_URL is set (the https url telegram posts the updates to), the bot gets the updates by a webhook
+# that listens on TELEGRAM_WEBHOOK_LISTEN:TELEGRAM_WEBHOOK_PORT, otherwise the bot long polls getUpdates
+TELEGRAM_WEBHOOK_URL = os.environ.get('TELEGRAM_WEBHOOK_URL')
+TELEGRAM_WEBHOOK_LISTEN = os.environ.get('TELEGRAM_WEBHOOK_LISTEN', '0.0.0.0')
+TELEGRAM_WEBHOOK_PORT = int(os.environ.get('TELEGRAM_WEBHOOK_PORT', '8443'))
+# sent by telegram in every request of the webhook, requests without it are rejected
+TELEGRAM_WEBHOOK_SECRET = os.environ.get('TELEGRAM_WEBHOOK_SECRET')
+# the number of requests telegram sends to the webhook at the same time
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = int(os.environ.get('TELEGRAM_WEBHOOK_MAX_CONNECTIONS', '40'))
 
 users = {}
 
 
 def get_user(f):
     async def function(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        user = database.get_user_by_id(update.effective_chat.id)
-        if not user:
-            await enter_data(context.bot, update.effective_chat.id)
-            return
-        return await f(user, update, context, *args, **kwargs)
+        async with tracing.command(f.__name__, chat_id=update.effective_chat.id):
+            user = database.get_user_by_id(update.effective_chat.id)
+            if not user:
+                await enter_data(context.bot, update.effective_chat.id)
+                return
+            return await f(user, update, context, *args, **kwargs)
 
     return function
 
@@ -28,18 +51,27 @@ def get_user(f):
 def internet_func(internet_function, value_on_error=None, btn_name=None, btn_value_func=None, get_message=False):
     def decorator(function):
         @get_user
+        @functools.wraps(function)
         async def actual_function(user: database.User, update: Update, context: ContextTypes.DEFAULT_TYPE):
-
-            if btn_name:
-                btn_value = update.callback_query.data[len(btn_name):]
-                if btn_value_func:
-                    btn_value = btn_value_func(btn_value)
-                res = internet_function(Internet(user), btn_value)
-            elif get_message:
-                res = internet_function(Internet(user), update.message.text)
-            else:
-                res = internet_function(Internet(user))
-
+            start = time.perf_counter()
+            try:
+                return await run_command(user, update, context)
+            finally:
+                metrics.COMMAND_SECONDS.labels(function.__name__).observe(time.perf_counter() - start)
+
+        async def run_command(user: database.User, update: Update, context: ContextTypes.DEFAULT_TYPE):
+            async with pool.session(user) as internet:
+                if btn_name:
+                    btn_value = update.callback_query.data[len(btn_name):]
+                    if btn_value_func:
+                        btn_value = btn_value_func(btn_value)
+                    res = await internet_function(internet, btn_value)
+                elif get_message:
+                    res = await internet_function(internet, update.message.text)
+                else:
+                    res = await internet_function(internet)
+
+            metrics.count_error(internet_function.__name__, res.error)
             if res.warnings:
                 await handle_warnings(res.warnings, context.bot, update.effective_chat.id)
             if res.error:
@@ -89,6 +121,9 @@ async def handle_error(error: Internet.Error, bot: telegram.Bot, chat_id: int):
     elif error is Internet.Error.OLD_EQUAL_NEW_PASSWORD:
         await bot.send_message(chat_id=chat_id,
                                text="error: Please enter password that was never in use or /cancel to cancel")
+    elif error is Internet.Error.GRADES_CHANGED:
+        await bot.send_message(chat_id=chat_id,
+                               text="error: the grades changed, please use /get_grade_distribution again")
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -126,7 +161,9 @@ async def get_password(update: Update, context: ContextTypes.DEFAULT_TYPE):
     password = update.message.text
     database.add_user(update.effective_chat.id, username, password)
     await context.bot.deleteMessage(update.effective_chat.id, update.message.id)
-    if Internet(database.User(update.effective_chat.id, username, password, 0, 0)).connect_orbit().result:
+    async with pool.session(database.User(update.effective_chat.id, username, password, 0, 0)) as internet:
+        connected = (await internet.connect_orbit()).result
+    if connected:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="Thanks")
         return ConversationHandler.END
     else:
@@ -158,7 +195,9 @@ async def call_back_time_table_button(_, res, update: Update, context: ContextTy
 
 
 @internet_func(Internet.get_grades)
-async def get_grades(_, grades, update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def get_grades(user, grades, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # the user sees all the grades now, the grades poller should not send them again
+    grade_poller.update_snapshot(user.user_id, grades)
     sum_grades = 0
     num_of_units = 0
     for grade in grades:
@@ -185,11 +224,29 @@ async def set_year(_, years, update: Update, context: ContextTypes.DEFAULT_TYPE)
     await context.bot.send_message(chat_id=update.effective_chat.id, text='select year', reply_markup=keyword)
 
 
+@get_user
+async def get_grade_distribution(user, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # the subjects are taken from the grades snapshot when it is fresh, without going to orbit
+    grades = grade_poller.get_fresh_grades(user.user_id)
+    if grades is None:
+        await get_grade_distribution_from_orbit(update, context)
+    else:
+        await send_grade_distribution_menu(user, grades, update, context)
+
+
 @internet_func(Internet.get_grades)
-async def get_grade_distribution(_, grades, update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def get_grade_distribution_from_orbit(user, grades, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # the grades are saved for the next menus, the grades the user did not see yet are sent like the poller does
+    published = grade_poller.update_snapshot(user.user_id, grades)
+    if published:
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=grade_poller.new_grades_text(published))
+    await send_grade_distribution_menu(user, grades, update, context)
+
+
+async def send_grade_distribution_menu(_, grades, update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyword = InlineKeyboardMarkup(
         [
-            [InlineKeyboardButton(f'{grade.name}', callback_data=f'grade_distribution_{grade.grade_distribution}')]
+            [InlineKeyboardButton(f'{grade.name}', callback_data=f'grade_distribution_{grade_distribution_key(grade)}')]
             for grade in grades if grade.grade_distribution
         ]
     )
@@ -300,11 +357,12 @@ async def call_back_register_button(update: Update, context: ContextTypes.DEFAUL
         return
     register_data = update.callback_query.data[len('register_period_'):].split('_')
     register_data[0] = register_data[0] == '1'
-    res = Internet(data).register_exam(register_data[1], register_data[0])
-    if res.error:
-        await handle_error(res.error, context.bot, update.effective_chat.id)
-        return
-    exams = Internet(data).get_all_exams()
+    async with pool.session(data) as internet:
+        res = await internet.register_exam(register_data[1], register_data[0])
+        if res.error:
+            await handle_error(res.error, context.bot, update.effective_chat.id)
+            return
+        exams = await internet.get_all_exams()
     if exams.error:
         await handle_error(exams.error, context.bot, update.effective_chat.id)
         return
@@ -403,8 +461,32 @@ change_password_handler = ConversationHandler(
 )
 
 
-def start_telegram_bot(token: str):
-    application = ApplicationBuilder().token(token).build()
+def start_telegram_bot(token: str,
+                       on_start: Callable[[Application], Awaitable] = None,
+                       on_stop: Callable[[Application], Awaitable] = None):
+    """
+    run the bot until it is stopped (by a webhook if TELEGRAM_WEBHOOK_URL is set, otherwise by polling)
+    :param token: the token of the bot
+    :param on_start: async function that is called in the event loop of the bot after the bot is initialized
+    :param on_stop: async function that is called when the bot stops (before the sessions are closed)
+    :return:
+    """
+    async def post_init(application: Application):
+        if HTTP_WARM_UP_CONNECTIONS:
+            # in the background, the bot does not wait for it to start getting updates
+            application.create_task(Internet.warm_up(HTTP_WARM_UP_CONNECTIONS))
+        if on_start:
+            await on_start(application)
+
+    async def post_shutdown(application: Application):
+        if on_stop:
+            await on_stop(application)
+        await pool.close()
+
+    # the updates of different chats are handled concurrently, the updates of one chat one after the other
+    application = ApplicationBuilder().token(token).base_url(TELEGRAM_API_URL) \
+        .concurrent_updates(ChatUpdateProcessor()).rate_limiter(SendQueue()) \
+        .post_init(post_init).post_shutdown(post_shutdown).build()
     application.add_handler(CommandHandler('get_grades', get_grades))
     application.add_handler(CommandHandler('get_unfinished_events', get_unfinished_events))
     application.add_handler(CommandHandler('get_document', get_document_buttons))
@@ -430,7 +512,15 @@ def start_telegram_bot(token: str):
     application.add_handler(CallbackQueryHandler(call_back_get_grade_distribution_button,
                                                  pattern=r'^grade_distribution_'))
 
-    application.run_polling()
+    if TELEGRAM_WEBHOOK_URL:
+        application.run_webhook(listen=TELEGRAM_WEBHOOK_LISTEN,
+                                port=TELEGRAM_WEBHOOK_PORT,
+                                url_path=urlsplit(TELEGRAM_WEBHOOK_URL).path.lstrip('/'),
+                                webhook_url=TELEGRAM_WEBHOOK_URL,
+                                secret_token=TELEGRAM_WEBHOOK_SECRET,
+                                max_connections=TELEGRAM_WEBHOOK_MAX_CONNECTIONS)
+    else:
+        application.run_polling()
 
 
 if __name__ == '__main__':
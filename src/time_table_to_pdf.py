@@ -1,13 +1,39 @@
+import functools
 import math
+import re
 
 from PIL import ImageFont
 from fpdf import FPDF
 from fpdf.enums import Align
 
+# the width of a text in the pdf is its length in the font divided by that
+WIDTH_SCALE = 2.69
+# the number of (text, width) pairs that are kept laid out
+LAYOUT_CACHE_SIZE = 4096
+
+
+class GlyphWidths(dict):
+    """
+    the advance width of every glyph of a font, every glyph is measured only once.
+    the font has no kerning, so the width of a text is the sum of the widths of its glyphs
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        super().__init__()
+        self.font = font
+
+    def __missing__(self, char: str) -> float:
+        width = self[char] = self.font.getlength(char)
+        return width
+
 
 class HebrewTimeTablePDF(FPDF):
     __hebrew_chars = '()אבגדהוזחטיכלמנסעפצקרשתםךףץן '
-    __font = ImageFont.truetype("david.ttf", 10)
+    __font = ImageFont.truetype("david.ttf", 10, layout_engine=ImageFont.Layout.BASIC)
+    __glyph_widths = GlyphWidths(__font)
+    __mirror = str.maketrans('()', ')(')
+    # the text is split to runs of hebrew, runs of other chars (that are written left to right) and new lines
+    __runs = re.compile(f'\n|[{re.escape(__hebrew_chars)}]+|[^{re.escape(__hebrew_chars)}\n]+')
 
     def __init__(self, time_table_data, *args, **kwargs):
         super().__init__(*args, orientation='L', **kwargs)
@@ -19,53 +45,40 @@ class HebrewTimeTablePDF(FPDF):
         self.draw_time_table(time_table_data)
 
     @staticmethod
+    @functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
     def __hebrew_fixer(text: str, max_width) -> str:
+        """
+        wrap the text to lines narrower than `max_width` and reorder it to visual order (right to left)
+        :param text: the text in logical order
+        :param max_width: the width of the cell
+        :return: the text in visual order
+        """
+        widths = HebrewTimeTablePDF.__glyph_widths
+        space_width = widths[' ']
         new_text = []
         for line in text.split('\n'):
             new_text.append('')
+            line_width = 0
             for word in line.split(' '):
+                word_width = sum(map(widths.__getitem__, word))
                 if not new_text[-1]:
                     new_text[-1] = word
-                elif HebrewTimeTablePDF.get_width(new_text[-1] + ' ' + word) < max_width:
+                    line_width = word_width
+                elif (line_width + space_width + word_width) / WIDTH_SCALE < max_width:
                     new_text[-1] += ' ' + word
+                    line_width += space_width + word_width
                 else:
                     new_text.append(word)
+                    line_width = word_width
 
-        new_text = [text for text in new_text][::-1]
-        text = '\n'.join(new_text)
-        if not text:
-            return ''
-        text = text[::-1]
-        text = ''.join([chr(ord('(') + ord(')') - ord(char)) if char in '()' else char for char in text])
-        start = 0
-        is_hebrew = text[0] in HebrewTimeTablePDF.__hebrew_chars
-        end_text = ''
-        for index, char in enumerate(text):
-            if (char in HebrewTimeTablePDF.__hebrew_chars) != is_hebrew or char == '\n':
-                if is_hebrew:
-                    end_text += text[start:index]
-                else:
-                    if start > 0:
-                        end_text += text[index - 1:start - 1:-1]
-                    else:
-                        end_text += text[index - 1::-1]
-                if char == '\n':
-                    is_hebrew = '\n'
-                else:
-                    is_hebrew = char in HebrewTimeTablePDF.__hebrew_chars
-                start = index
-        if is_hebrew:
-            end_text += text[start:]
-        else:
-            if start == 0:
-                end_text += text[::-1]
-            else:
-                end_text += text[:start - 1:-1]
-        return end_text
+        # every line is reversed (with the brackets mirrored), then the runs that are not hebrew are reversed back
+        text = '\n'.join(line[::-1] for line in new_text).translate(HebrewTimeTablePDF.__mirror)
+        return ''.join(run if run[0] in HebrewTimeTablePDF.__hebrew_chars else run[::-1]
+                       for run in HebrewTimeTablePDF.__runs.findall(text))
 
     @staticmethod
     def get_width(text: str) -> float:
-        return HebrewTimeTablePDF.__font.getlength(text) / 2.69
+        return sum(map(HebrewTimeTablePDF.__glyph_widths.__getitem__, text)) / WIDTH_SCALE
 
     @staticmethod
     def get_days(time_table_data):
@@ -0,0 +1,147 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+# if TRACE_DIR is set, the spans of every command are written to a file in that dir,
+# in the trace event format of chrome (open it in https://ui.perfetto.dev or chrome://tracing)
+TRACE_DIR = os.environ.get('TRACE_DIR')
+# the part of the commands that run under cProfile (one command at a time)
+TRACE_PROFILE_RATE = float(os.environ.get('TRACE_PROFILE_RATE', '0.1'))
+# the profile of a command is written (as a pstats file, open it with `python -m pstats` or snakeviz)
+# only if the command took longer than that
+TRACE_SLOW_SECONDS = float(os.environ.get('TRACE_SLOW_SECONDS', '2'))
+
+ENABLED = bool(TRACE_DIR)
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar[Optional['_Trace']] = contextvars.ContextVar('trace', default=None)
+# cProfile can profile only one command at a time
+_profiling = False
+
+
+class _Trace:
+    """
+    the spans of one command
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.events = []
+        self.__threads = {}
+
+    def add(self, name: str, start: float, end: float, args: dict):
+        self.events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': self.__thread_id(),
+                            'ts': (start - self.start) * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+
+    def __thread_id(self) -> int:
+        """
+        every task (and every thread) of the command is a separate row in the trace, so concurrent spans do not overlap
+        """
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        return self.__threads.setdefault((threading.get_ident(), id(task)), len(self.__threads) + 1)
+
+    def write(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+
+@contextmanager
+def span(name: str, **args):
+    """
+    record the time of the block as a span of the current command (nothing is recorded outside of a command)
+    :param name: the name of the span
+    :param args: shown with the span
+    :return:
+    """
+    trace = _current.get()
+    if not trace:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), args)
+
+
+def traced(function):
+    """
+    decorator that records every call of the function (sync or async) as a span,
+    the function is returned as is when tracing is not enabled
+    :param function:
+    :return:
+    """
+    if not ENABLED:
+        return function
+    name = f'{function.__module__}.{function.__name__}'
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def async_wrapper(*args, **kwargs):
+            with span(name):
+                return await function(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+@asynccontextmanager
+async def command(name: str, **args):
+    """
+    trace a command (if tracing is enabled): the spans inside the block are written to a file in TRACE_DIR,
+    some of the commands also run under cProfile (that profiles all the tasks in the event loop at that time)
+    :param name: the name of the command
+    :param args: shown with the span of the command
+    :return:
+    """
+    global _profiling
+    if not ENABLED or _current.get():
+        yield
+        return
+
+    trace = _Trace(name)
+    token = _current.set(trace)
+    profile = None
+    if not _profiling and random.random() < TRACE_PROFILE_RATE:
+        _profiling = True
+        profile = cProfile.Profile()
+        profile.enable()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if profile:
+            profile.disable()
+            _profiling = False
+        trace.add(name, trace.start, end, args)
+        _current.reset(token)
+
+        file_name = re.sub(r'[^\w-]', '_', name)
+        path = os.path.join(TRACE_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}-{file_name}-{os.getpid()}-{id(trace)}')
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            trace.write(f'{path}.json')
+            if profile and end - trace.start > TRACE_SLOW_SECONDS:
+                profile.dump_stats(f'{path}.prof')
+        except OSError:
+            logger.exception('could not write the trace of %s', name)
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Dict
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+# the most updates that are handled at the same time (of all the chats)
+MAX_CONCURRENT_UPDATES = 256
+
+
+class ChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    handle the updates of different chats concurrently, and the updates of one chat one after the other.
+    the state of a `ConversationHandler` changes only when its callback returns,
+    so the next message of the chat must wait for it (like with `concurrent_updates(False)`)
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        # the lock of every chat that has an update that is handled or waiting, and the number of those updates
+        self.__chats: Dict[int, asyncio.Lock] = {}
+        self.__pending: Dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if not chat:
+            await coroutine
+            return
+
+        lock = self.__chats.setdefault(chat.id, asyncio.Lock())
+        self.__pending[chat.id] = self.__pending.get(chat.id, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self.__pending[chat.id] -= 1
+            if not self.__pending[chat.id]:
+                del self.__pending[chat.id]
+                del self.__chats[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
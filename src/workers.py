@@ -0,0 +1,51 @@
+import asyncio
+import logging
+import time
+from collections import namedtuple
+from typing import Awaitable, Callable, Iterable
+
+from telegram.ext import ExtBot
+
+import database
+
+RunStats = namedtuple('RunStats', 'users failures wall_time')
+
+logger = logging.getLogger(__name__)
+
+
+async def run_for_users(bot: ExtBot,
+                        all_users: Iterable[database.User],
+                        job: Callable[[ExtBot, database.User], Awaitable[bool]],
+                        concurrency: int) -> RunStats:
+    """
+    run a job for all the users, at most `concurrency` users are handled at the same time.
+    the users are taken from `all_users` only when a worker is free, so a stream of users is not read ahead
+    :param bot: the bot to send the messages with
+    :param all_users: the users to run the job for
+    :param job: async function that gets the bot and a user, and returns is the job succeeded
+        (a job that raised is counted as failed)
+    :param concurrency: the number of users handled at the same time
+    :return: the stats of the run
+    """
+    start = time.monotonic()
+    users = iter(all_users)
+    processed = 0
+    failures = 0
+
+    async def worker():
+        nonlocal processed, failures
+        # all the workers take the next user from the same iterator
+        for user in users:
+            processed += 1
+            try:
+                if not await job(bot, user):
+                    failures += 1
+            except Exception:
+                failures += 1
+                logger.exception('%s of %s failed', job.__name__, user.user_id)
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    stats = RunStats(users=processed, failures=failures, wall_time=time.monotonic() - start)
+    logger.info('%s: %d users, %d failures, %.1f seconds', job.__name__, *stats)
+    return stats